@@ -0,0 +1,116 @@
+"""
+assets.py
+This file handles the card images of the client.
+The PNG files of images/ are packed into a single atlas file (run 'python3 assets.py' to build it, the GUI also builds it
+when it is missing or older than images/). The atlas is memory-mapped and an image is only decoded the first time it is used,
+so the start up time does not depend on the number of card faces. A background thread decodes the most common cards ahead.
+Atlas format: ATLAS_MAGIC, 4 bytes big-endian length of the index, the JSON index {name: [offset, length]},
+then the PNG files one after another. Offsets start right after the index.
+"""
+import json
+import mmap
+import os
+import struct
+from io import BytesIO
+from threading import Lock, Thread
+from PIL import Image
+from cards import *
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images')
+ATLAS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images.atlas')
+ATLAS_MAGIC = b'UNOATLS1'
+
+
+def image_names():
+    #Every image the GUI shows, the most common cards first: there are two of each number and action card per color
+    names = [color + symbol for color in COLOR_LIST for symbol in SYMBOL_LIST]
+    names += [color + symbol for color in COLOR_LIST + WILD_LIST for symbol in WILD_SYMBOL_LIST]
+    names += list(COLOR_LIST)
+    return names
+
+
+def build_atlas(image_dir = IMAGE_DIR, atlas_path = ATLAS_PATH):
+    index, blobs, offset = {}, [], 0
+    for file_name in sorted(os.listdir(image_dir)):
+        if not file_name.endswith('.png'):
+            continue
+        with open(os.path.join(image_dir, file_name), 'rb') as f:
+            blob = f.read()
+        index[file_name[:-len('.png')]] = [offset, len(blob)]
+        blobs.append(blob)
+        offset += len(blob)
+    index_bytes = json.dumps(index).encode()
+    #Write to a temporary file first, so a running client never maps a half written atlas
+    with open(atlas_path + '.tmp', 'wb') as f:
+        f.write(ATLAS_MAGIC + struct.pack('>I', len(index_bytes)) + index_bytes)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(atlas_path + '.tmp', atlas_path)
+
+
+def atlas_is_stale(image_dir = IMAGE_DIR, atlas_path = ATLAS_PATH):
+    if not os.path.exists(atlas_path):
+        return True
+    atlas_time = os.path.getmtime(atlas_path)
+    return any(os.path.getmtime(os.path.join(image_dir, name)) > atlas_time for name in os.listdir(image_dir))
+
+
+class Atlas:
+    def __init__(self, atlas_path = ATLAS_PATH):
+        with open(atlas_path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        if self.data[:len(ATLAS_MAGIC)] != ATLAS_MAGIC:
+            raise ValueError("Not an image atlas: " + atlas_path)
+        index_length = struct.unpack('>I', self.data[len(ATLAS_MAGIC):len(ATLAS_MAGIC) + 4])[0]
+        index_start = len(ATLAS_MAGIC) + 4
+        self.index = json.loads(self.data[index_start:index_start + index_length])
+        self.data_start = index_start + index_length
+
+    def open(self, name):
+        offset, length = self.index[name]
+        start = self.data_start + offset
+        return Image.open(BytesIO(self.data[start:start + length]))
+
+
+class LazyImages:
+    """Mapping of image name to decoded PIL image. An image is read from the atlas (or from images/ if there is no atlas)
+    and decoded the first time it is looked up. It can be used from several threads."""
+    def __init__(self, atlas = None):
+        self.atlas = atlas
+        self.images = {}
+        self.lock = Lock()
+
+    def __getitem__(self, name):
+        image = self.images.get(name)
+        if image is None:
+            with self.lock:
+                image = self.images.get(name)
+                if image is None:
+                    image = self.atlas.open(name) if self.atlas else Image.open(os.path.join(IMAGE_DIR, name + '.png'))
+                    image.load()
+                    self.images[name] = image
+        return image
+
+    def preload(self, names):
+        #Decode the given images in a background thread
+        def worker():
+            for name in names:
+                self[name]
+        Thread(target = worker, daemon = True).start()
+
+
+def load_images():
+    #Open the atlas, building it first if needed. Falls back to reading images/ if the atlas can not be written
+    try:
+        if atlas_is_stale():
+            build_atlas()
+        images = LazyImages(Atlas())
+    except OSError:
+        images = LazyImages()
+    images.preload(image_names())
+    return images
+
+
+if __name__ == '__main__':
+    build_atlas()
+    print("Atlas written to " + ATLAS_PATH)
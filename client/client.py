@@ -5,18 +5,44 @@ Ray Gong, ruiduoray@berkeley.edu, 8/22/2020
 """
 
 import json
-from requests import post, get
+from threading import Lock
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cards import *
 
 
 #Local URL is used when server is running on local
 LOCAL_URL = 'http://127.0.0.1:5000/api/'
 SERVER_URL = 'This should be the actual server url'
 TIMEOUT = 1
+#Timeouts in seconds of the endpoints that need another one than TIMEOUT.
+#The server holds a wait_update request open for up to 25 seconds, so it gets a longer timeout
+ENDPOINT_TIMEOUTS = {'wait_update': 30, 'test_connection': 3}
+#Connections that could not be opened are retried for every request. Other failures are retried for GET requests only,
+#since sending a POST like play_card twice is not safe. The n-th retry waits BACKOFF_FACTOR * 2 ** (n - 1) seconds
+RETRIES = 2
+BACKOFF_FACTOR = 0.1
+#Connections kept alive to the server. The GUI sends requests from a few threads at the same time
+POOL_SIZE = 4
 #Set LOCAL to True to use LOCAL_URL and set to False to use SERVER_URL when sending requests
 LOCAL = True
 
 class Client:
     def __init__(self):
+        self.base_url = LOCAL_URL if LOCAL else SERVER_URL
+        self.session = Session()
+        retry = Retry(total = RETRIES, connect = RETRIES, read = RETRIES, status = RETRIES, backoff_factor = BACKOFF_FACTOR,
+            status_forcelist = [502, 503, 504], raise_on_status = False)
+        adapter = HTTPAdapter(pool_connections = 1, pool_maxsize = POOL_SIZE, max_retries = retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.etags = {}
+        self.cached_responses = {}
+        self.game_state, self.game_version = None, None
+        #The game state is patched by get_game_info and batch, which the GUI calls from several threads
+        self.game_lock = Lock()
+        self.username = None
         self.test_connection()
 
     def test_connection(self):
@@ -29,19 +55,57 @@ class Client:
         status_code, response =  self.__post_request__('create_username', {'username': username})
         if status_code == 200:
             self.username = username
+            #Every later request carries the session token, which is also valid on the other servers of the same game
+            self.session.headers['Authorization'] = 'Bearer ' + response['token']
         return status_code, response
 
     def change_username(self, new_username):
         status_code, response = self.__post_request__('change_username', {'new_username':new_username})
         if status_code == 200:
-            self.username = username
+            self.username = new_username
         return status_code, response
 
     def create_room(self):
-        return self.__post_request__('create_room')
+        status_code, response = self.__post_request__('create_room')
+        if status_code == 200:
+            self.__forget_room__()
+        return status_code, response
 
     def join_room(self, room_number):
-        return self.__post_request__('join_room', {'room_number': room_number})
+        status_code, response = self.__post_request__('join_room', {'room_number': room_number})
+        if status_code == 421:
+            #The room is served by another server of the same game, use that server from now on
+            self.base_url = response['server_url']
+            self.etags, self.cached_responses = {}, {}
+            status_code, response = self.__post_request__('join_room', {'room_number': room_number})
+        if status_code == 200:
+            self.__forget_room__()
+        return status_code, response
+
+    def __forget_room__(self):
+        #The cached states of the previous room must never be shown for a new one, even if an ETag happens to match
+        self.etags, self.cached_responses = {}, {}
+        self.__forget_game__()
+
+    def __forget_game__(self):
+        #A patch is only applied to a state of the same game
+        with self.game_lock:
+            self.game_state, self.game_version = None, None
+
+    def quick_match(self, players):
+        """Wait for a game of the given number of players. The response has the room_number once the user is seated, None before.
+        A waiting client calls wait_update('lobby') and then match_status"""
+        status_code, response = self.__post_request__('quick_match', {'players': players})
+        if status_code == 200:
+            #The room the user gets seated in is a new one
+            self.__forget_room__()
+        return status_code, response
+
+    def match_status(self):
+        return self.__post_request__('match_status')
+
+    def cancel_match(self):
+        return self.__post_request__('cancel_match')
 
     def quit_room(self):
         return self.__post_request__('quit_room')
@@ -49,23 +113,70 @@ class Client:
     def send_exit_signal(self):
         self.__post_request__('exit_signal')
 
-    def get_lobby_info(self):
-        return self.__get_request__('lobby_info')
+    def get_lobby_info(self, page = None, page_size = None, waiting = False, free_seats = False, host = None):
+        """Fetch the lobby. With a page, only the rooms of that page are sent, see lobby_info in the server api.py for the filters"""
+        params = {'page': page, 'page_size': page_size, 'waiting': 1 if waiting else None, 'free_seats': 1 if free_seats else None, 'host': host}
+        return self.__conditional_request__('GET', 'lobby_info', {key: value for key, value in params.items() if value is not None})
 
     def get_room_info(self):
-        return self.__post_request__('room_info')
+        return self.__conditional_request__('POST', 'room_info')
 
     def start_game(self):
         return self.__post_request__('start_game')
 
+    def add_bot(self):
+        return self.__post_request__('add_bot')
+
+    def remove_bot(self, bot_name):
+        return self.__post_request__('remove_bot', {'bot_name': bot_name})
+
     def user_ready(self):
         return self.__post_request__('user_ready')
 
     def get_game_meta_data(self):
-        return self.__post_request__('game_meta_data')
+        #The game page fetches the meta data once per game, the state of the previous game of the room is dropped then
+        status_code, response = self.__post_request__('game_meta_data')
+        if status_code == 200:
+            self.__forget_game__()
+        return status_code, response
 
     def get_game_info(self):
-        return self.__post_request__('game_info')
+        """Fetch the changes since the last known game state through game_patch and apply them.
+        Returns the whole game state, in the same type as the game_info endpoint."""
+        with self.game_lock:
+            data = {'version': self.game_version} if self.game_state is not None else {}
+            data['compact'] = 1
+            response = self.__send__('POST', 'game_patch', data)
+            if response.status_code == 304:
+                return response.status_code, self.game_state
+            data = response.json()
+            if response.status_code != 200:
+                return response.status_code, data
+            self.__apply_game_patch__(data)
+            return response.status_code, self.game_state
+
+    def batch(self, actions):
+        """Run the actions in order in one request, such as [{'action': 'draw_card'}, {'action': 'skip_card'}], see batch in the server api.py.
+        Returns the status code and {'results': the result of each action run, 'game': the whole game state after the actions}"""
+        with self.game_lock:
+            data = {'actions': json.dumps(actions), 'compact': 1}
+            if self.game_state is not None:
+                data['version'] = self.game_version
+            response = self.__send__('POST', 'batch', data)
+            data = response.json()
+            if response.status_code != 200:
+                return response.status_code, data
+            if data['game'] is not None:
+                self.__apply_game_patch__(data['game'])
+            return response.status_code, {'results': data['results'], 'game': self.game_state}
+
+    def __apply_game_patch__(self, data):
+        #Update the game state with a game_patch response
+        if data['full']:
+            self.game_state = expand_state(data['state'])
+        else:
+            self.game_state = apply_patch(self.game_state, expand_patch(data['patch']))
+        self.game_version = data['version']
 
     def play_card(self, color, symbol, wild_color = None):
         return self.__post_request__('play_card', {'color': color, 'symbol': symbol, 'wild_color': wild_color})
@@ -76,20 +187,77 @@ class Client:
     def skip_card(self):
         return self.__post_request__('skip_card')
 
+    def wait_update(self, channel, version = -1):
+        """Block until the server reports a change on the channel ('lobby' or 'room') since the given version, -1 for any.
+        Returns the version of the channel, the given one if the request timed out, or None if the request failed.
+        Each caller keeps its own version, so overlapping waits never overwrite each other's."""
+        status_code, response = self.__post_request__('wait_update', {'channel': channel, 'version': version})
+        if status_code != 200:
+            return None
+        return response['version']
+
+    def __conditional_request__(self, method, endpoint, params = None):
+        """Send the ETag of the last response of the endpoint. If the server answers 304 Not Modified
+        the cached response is returned together with the 304 status code."""
+        headers = {'If-None-Match': self.etags[endpoint]} if endpoint in self.etags else {}
+        response = self.__send__(method, endpoint, headers = headers, params = params)
+        if response.status_code == 304:
+            return response.status_code, self.cached_responses[endpoint]
+        data = response.json()
+        if response.status_code == 200 and 'ETag' in response.headers:
+            self.etags[endpoint] = response.headers['ETag']
+            self.cached_responses[endpoint] = data
+        else:
+            self.etags.pop(endpoint, None)
+        return response.status_code, data
+
     def __get_request__(self, endpoint):
-        url = LOCAL_URL + endpoint
-        response = get(url)
+        response = self.__send__('GET', endpoint)
         return response.status_code, response.json()
 
     def __post_request__(self, endpoint, data = None):
-        if not data:
-            data = {}
-        if 'username' not in data:
-            data['username'] = self.username
-        url = LOCAL_URL + endpoint if LOCAL else SERVER_URL + endpoint
-        response = post(url, data=data, timeout=TIMEOUT)
+        response = self.__send__('POST', endpoint, data)
         return response.status_code, response.json()
 
+    def __send__(self, method, endpoint, data = None, headers = None, params = None):
+        timeout = ENDPOINT_TIMEOUTS.get(endpoint, TIMEOUT)
+        if method == 'GET':
+            return self.session.get(self.base_url + endpoint, params=params, headers=headers, timeout=timeout)
+        return self.session.post(self.base_url + endpoint, data=data, timeout=timeout, headers=headers)
+
+
+def apply_patch(state, patch):
+    """Return a new game state with the patch of the game_patch endpoint applied. Only the changed fields are copied,
+    so the given state stays untouched."""
+    state = dict(state)
+    state.update(patch['set'])
+    for key in ['player_colors', 'player_card_nums']:
+        if patch[key]:
+            state[key] = list(state[key])
+            for index, value in patch[key].items():
+                state[key][int(index)] = value
+    if patch['cards_added'] or patch['cards_removed']:
+        cards = list(state['cards'])
+        for card in patch['cards_removed']:
+            cards.remove(card)
+        state['cards'] = cards + patch['cards_added']
+    return state
+
+
+def expand_state(state):
+    #Turn a game state sent in the compact format back into the game_info format
+    state['cards'] = unpack_cards(state['cards'])
+    state['top_card'] = [code_color(state['top_card']), code_symbol(state['top_card'])]
+    return state
+
+
+def expand_patch(patch):
+    if 'top_card' in patch['set']:
+        patch['set']['top_card'] = [code_color(patch['set']['top_card']), code_symbol(patch['set']['top_card'])]
+    patch['cards_added'] = unpack_cards(patch['cards_added'])
+    patch['cards_removed'] = unpack_cards(patch['cards_removed'])
+    return patch
+
 
 class ServerDownException(Exception):
     def __init__(self, msg):
@@ -8,14 +8,19 @@ Ray Gong, ruiduoray@berkeley.edu, 8/22/2020
 from client import *
 from tkinter import *
 from tkinter import messagebox
-from PIL import ImageTk, Image
 from cards import *
+from image_cache import *
+from assets import *
 import atexit
 from time import localtime, strftime
+from threading import Thread
+from queue import Queue, Empty
+from concurrent.futures import ThreadPoolExecutor
 
 
-IMAGE_DICT = {}
 COLOR = {'white': '#FFFFFF', 'grey': '#B2B3A5', 'yellow': '#DCEC1B', 'green': '#20FA20'} 
+EVENT_INTERVAL = 50 #Milliseconds between checks of the results coming from the background threads
+WORKERS = 3 #Threads sending the requests of the GUI. The long-polls of wait_update have their own thread
 
 
 def log_with_timestamp(msg):
@@ -30,32 +35,103 @@ class ClientGUI:
         self.root.minsize(500,500)
         self.next_page = self.create_username_page
         self.client = None
+        self.events = Queue()
+        self.page_id = 0
+        #Channel: last version seen by the waits of the current page. Only written on the Tk thread
+        self.versions = {}
+        self.executor = ThreadPoolExecutor(max_workers = WORKERS)
+        self.in_flight = {}
+        self.exited = False
+        #The images are decoded on first use, see assets.py
+        self.images = ImageCache(load_images())
         try:
             self.client = Client()
             self.create_username_page()
             log_with_timestamp("Client Initialized")
-            for color in COLOR_LIST:
-                for symbol in SYMBOL_LIST:
-                    IMAGE_DICT[color+symbol] = Image.open('Images/'+ color + symbol +'.png')
-                for symbol in WILD_SYMBOL_LIST:
-                    IMAGE_DICT[color+symbol] = Image.open('Images/'+ color + symbol +'.png')
-            for color in WILD_LIST:
-                for symbol in WILD_SYMBOL_LIST:
-                    IMAGE_DICT[color+symbol] = Image.open('Images/'+ color + symbol +'.png')
-            for color in COLOR_LIST:
-                IMAGE_DICT[color] = Image.open('Images/' + color + '.png')
-            log_with_timestamp("Images Loaded")
         except ServerDownException:
             log_with_timestamp("Server not available")
             self.server_down_page()       
+        #The server is told when the window is closed, or when the program exits in any other way
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        atexit.register(self.exit)
+        self.root.after(EVENT_INTERVAL, self.process_events)
         self.root.mainloop()
 
 
+    def enter_page(self, channel):
+        #Updates waited by the previous page are dropped once a new page is entered
+        self.page_id += 1
+        self.versions.pop(channel, None)
+
+    def wait_update(self, channel, callback):
+        """Wait for a server side change of the channel in a background thread, then run callback on the Tk thread.
+        The version seen is only kept if the page did not change in the meantime."""
+        page_id, version = self.page_id, self.versions.get(channel, -1)
+        def worker():
+            seen = None
+            try:
+                seen = self.client.wait_update(channel, version)
+                while seen == version and page_id == self.page_id:
+                    seen = self.client.wait_update(channel, version)
+            except Exception as e:
+                log_with_timestamp("Wait update failed: " + str(e))
+            self.events.put((page_id, on_update, (seen,)))
+        def on_update(seen):
+            if seen is not None:
+                self.versions[channel] = seen
+            callback()
+        Thread(target = worker, daemon = True).start()
+
+    def request(self, client_call, args, callback, key = None):
+        """Run client_call(*args) on the worker threads, then run callback(status_code, response) on the Tk thread.
+        A request failing without response gives None as the status code. Results arriving after the page changed are dropped.
+        With a key, the request is not sent while another one with the same key is in flight. It is sent once that one returns."""
+        if key is not None:
+            if key in self.in_flight:
+                self.in_flight[key] = (client_call, args, callback)
+                return
+            self.in_flight[key] = None
+        page_id = self.page_id
+        def worker():
+            try:
+                result = client_call(*args)
+            except Exception as e:
+                log_with_timestamp("Request failed: " + str(e))
+                result = (None, {'error': str(e)})
+            self.events.put((None, finish, result))
+        def finish(status_code, response):
+            if key is not None:
+                pending = self.in_flight.pop(key)
+                if pending is not None:
+                    self.request(*pending, key = key)
+            if page_id == self.page_id:
+                callback(status_code, response)
+        self.executor.submit(worker)
+
+    def after_page(self, ms, callback):
+        #Like root.after, but the callback is dropped if the page changed in the meantime
+        page_id = self.page_id
+        self.root.after(ms, lambda: callback() if page_id == self.page_id else None)
+
+    def process_events(self):
+        #Run the callbacks queued by the background threads. A page_id of None means the callback runs on any page
+        try:
+            while True:
+                page_id, callback, args = self.events.get_nowait()
+                if page_id is None or page_id == self.page_id:
+                    callback(*args)
+        except Empty:
+            pass
+        self.root.after(EVENT_INTERVAL, self.process_events)
+
+
     def create_username_page(self):
         def create():
             username = username_entry.get()
             username_entry.delete(0, END)
-            status_code, response = self.client.create_username(username)
+            self.request(self.client.create_username, (username,), on_created)
+
+        def on_created(status_code, response):
             if status_code == 200:
                 frame.destroy()
                 self.root.after(30, self.lobby_page)
@@ -83,9 +159,15 @@ class ClientGUI:
         frame.place(relx = 0, rely = 0, relwidth = 1, relheight = 1)
         data, prev_data = None, None
         page_index = 1
+        waiting_update = False
+        match_players = None #Number of players of the quick match waited for
+        players_var = IntVar(value = 4)
+        self.enter_page('lobby')
 
         def create_room():
-            status_code, response = self.client.create_room()
+            self.request(self.client.create_room, (), enter_room)
+
+        def enter_room(status_code, response):
             if status_code != 200:
                 frame.destroy()
                 self.Error_page(status_code, response)
@@ -94,32 +176,83 @@ class ClientGUI:
                 self.root.after(30, self.room_page)
                 return
 
+        def click_quick_match():
+            self.request(self.client.quick_match, (players_var.get(),), on_match_status)
+
+        def click_cancel_match():
+            self.request(self.client.cancel_match, (), on_cancel_match)
+
+        def on_cancel_match(status_code, response):
+            nonlocal match_players
+            match_players = None
+            set_up_page()
+
+        def on_match_status(status_code, response):
+            nonlocal match_players
+            if status_code != 200:
+                if status_code is not None:
+                    match_players = None
+                    set_up_page()
+                return
+            if response['room_number'] is not None:
+                frame.destroy()
+                self.root.after(30, self.room_page)
+                return
+            if response['players'] != match_players:
+                match_players = response['players']
+                set_up_page()
+
         def refresh():
-            nonlocal data, prev_data
-            status_code, data = self.client.get_lobby_info()
+            #Only the rooms of the shown page are requested
+            self.request(self.client.get_lobby_info, (page_index, ROOMVIEW), on_lobby_info, key = 'lobby_info')
+
+        def on_lobby_update():
+            nonlocal waiting_update
+            waiting_update = False
+            refresh()
+            #A quick match seats the players in a new room, which changes the lobby
+            if match_players is not None:
+                self.request(self.client.match_status, (), on_match_status, key = 'match_status')
+
+        def on_lobby_info(status_code, response):
+            nonlocal data, prev_data, page_index, waiting_update
+            if status_code is None:
+                self.after_page(1000, refresh)
+                return
+            data = response
             log_with_timestamp('Refreshed Lobby')
-            if status_code != 200:
+            if status_code not in (200, 304):
                 frame.destroy()
                 self.Error_page(status_code, data)
             else:
+                #The server sends the last page instead of a page past the end
+                page_index = data['page']
                 if data != prev_data:
                     set_up_page()
-                else:
-                    frame.after(1000, refresh)
                 prev_data = data
+                #A page change also refreshes the lobby, only one wait is kept running
+                if not waiting_update:
+                    waiting_update = True
+                    self.wait_update('lobby', on_lobby_update)
 
         def set_up_page():
             log_with_timestamp("Setting up lobby!")
-            nonlocal frame, page_index
+            nonlocal frame
             frame.destroy()
             frame = Frame(self.root)
             frame.place(relx = 0, rely = 0, relwidth = 1, relheight = 1)
 
             create_button = Button(frame, text = "Create Room",command = create_room)
             create_button.place(relx = 0.7, rely = 0.05, relwidth = 0.2, relheight = 0.05)
+            if match_players is None:
+                Button(frame, text = "Quick Match", command = click_quick_match).place(relx = 0.1, rely = 0.05, relwidth = 0.2, relheight = 0.05)
+                Spinbox(frame, from_ = 2, to = 10, textvariable = players_var, state = 'readonly').place(relx = 0.32, rely = 0.05, relwidth = 0.08, relheight = 0.05)
+            else:
+                Button(frame, text = "Cancel Match", command = click_cancel_match).place(relx = 0.1, rely = 0.05, relwidth = 0.2, relheight = 0.05)
+                Label(frame, text = 'Waiting for a ' + str(match_players) + ' player game').place(relx = 0.32, rely = 0.05, relwidth = 0.35, relheight = 0.05)
 
-            room_numbers = list(data.keys())
-            room_numbers.sort()
+            rooms = data['rooms']
+            room_numbers = sorted(rooms, key = int)
 
             if len(room_numbers) == 0:
                 Label(frame, text = 'No room in the lobby. \nPress "Create Room" to create').place(relx = 0.1, rely = 0.1, relwidth = 0.8, relheight = 0.8)
@@ -128,31 +261,23 @@ class ClientGUI:
                     nonlocal page_index
                     if page_index > 1:
                         page_index -= 1
-                        set_up_page()
+                        refresh()
 
                 def click_next():
                     nonlocal page_index
-                    if page_index <= len(room_numbers) // ROOMVIEW:
+                    if page_index < data['page_count']:
                         page_index += 1
-                        set_up_page()
+                        refresh()
 
-                slice_room_numbers = room_numbers[ROOMVIEW * (page_index - 1) : ROOMVIEW * page_index]
                 counter = 0
-                for room_number in slice_room_numbers:
+                for room_number in room_numbers:
                     col = counter // ROWVIEW
                     row = counter % ROWVIEW
 
                     def join_click(room_number = room_number):
-                        status_code, response = self.client.join_room(room_number)
-                        if status_code != 200:
-                            frame.destroy()
-                            self.Error_page(status_code, response)
-                        else:
-                            frame.destroy()
-                            self.root.after(30, self.room_page)
-                            return
-
-                    room_info = data[room_number]
+                        self.request(self.client.join_room, (room_number,), enter_room)
+
+                    room_info = rooms[room_number]
                     status = 'In Game' if room_info['inGame'] else 'Waiting'
                     room_label = Label(frame, borderwidth=2, relief="groove", text = 'user: ' + str(room_info['user_number']) + '/10\nhostname: ' + str(room_info['hostname'] + '\nstatus: ' + status))
                     room_label.place(relx = 0.1 + row * ROWOFFSET, rely = 0.1 + col * COLOFFSET, relwidth = ROWOFFSET, relheight = COLOFFSET)
@@ -162,11 +287,9 @@ class ClientGUI:
                         Button(room_label, text = 'join', command = join_click).place(relx = 0.65, rely = 0.7, relwidth = 0.25, relheight = 0.2)
 
                     counter += 1
-                if len(room_numbers) > ROOMVIEW:
+                if data['page_count'] > 1:
                     Button(frame, text = 'back', command = click_back).place(relx = 0.1, rely = 0.9, relwidth = 0.2, relheight = 0.05)
                     Button(frame, text = 'next', command = click_next).place(relx = 0.7, rely = 0.9, relwidth = 0.2, relheight = 0.05)
-
-            frame.after(1000, refresh)
         refresh()
 
 
@@ -176,36 +299,50 @@ class ClientGUI:
 
         data, prev_data = None, None
         error_message, error_label = None, None
+        self.enter_page('room')
         def refresh():
+            self.request(self.client.get_room_info, (), on_room_info, key = 'room_info')
+
+        def on_room_info(status_code, response):
             nonlocal data, prev_data
-            status_code, data = self.client.get_room_info()
+            if status_code is None:
+                self.after_page(1000, refresh)
+                return
+            data = response
             log_with_timestamp("Refreshed Room")
-            if status_code != 200:
+            if status_code not in (200, 304):
                 frame.destroy()
                 self.Error_page(status_code, data)
             else:
                 if data != prev_data:
                     set_up_page()
-                else:
-                    frame.after(1000, refresh)
                 prev_data = data
+                #set_up_page already left for the game page, which waits on the room by itself
+                if not data['inGame']:
+                    self.wait_update('room', refresh)
 
         def click_start():
-            nonlocal error_message
-            status_code, response = self.client.start_game()
-            if status_code != 200:
-                error_message = response['error']
-                error_label.config(text = response['error'])
+            self.request(self.client.start_game, (), show_error)
 
         def click_ready():
+            self.request(self.client.user_ready, (), show_error)
+
+        def click_add_bot():
+            self.request(self.client.add_bot, (), show_error)
+
+        def click_remove_bot(bot_name):
+            self.request(self.client.remove_bot, (bot_name,), show_error)
+
+        def show_error(status_code, response):
             nonlocal error_message
-            status_code, response = self.client.user_ready()
             if status_code != 200:
                 error_message = response['error']
                 error_label.config(text = response['error'])
                
         def click_quit_room():
-            status_code, response = self.client.quit_room()
+            self.request(self.client.quit_room, (), on_quit_room)
+
+        def on_quit_room(status_code, response):
             if status_code != 200:
                 self.Error_page(status_code, response)
             else:
@@ -242,8 +379,14 @@ class ClientGUI:
                 Label(user_label, text = str(i)).place(relx = 0.02, rely = 0.02, relwidth = 0.2, relheight = 0.2)
                 if str(i) in users:
                     Label(user_label, borderwidth = 1, relief = 'groove', text = str(users[str(i)][0])).place(relx = 0.2, rely = 0.1, relwidth = 0.48, relheight = 0.8)
+                    if users[str(i)][0] in data.get('bots', []) and data['hostname'] == self.client.username:
+                        Button(user_label, text = 'Remove Bot', command = lambda name = users[str(i)][0]: click_remove_bot(name)).place(
+                            relx = 0.7, rely = 0.1, relwidth = 0.28, relheight = 0.8)
+                        continue
                     if users[str(i)][0] == data['hostname']:
                         ready_text = 'Host'
+                    elif users[str(i)][0] in data.get('bots', []):
+                        ready_text = 'Bot'
                     else:
                         ready_text = 'Ready' if users[str(i)][1] else 'Not Ready'
                     Message(user_label, borderwidth = 1, relief = 'groove', text = ready_text).place(relx = 0.7, rely = 0.1, relwidth = 0.28, relheight = 0.8)
@@ -253,16 +396,23 @@ class ClientGUI:
             error_label = Label(frame, text = error_message)
             error_label.place(relx = 0.1, rely = 0.05, relwidth = 0.6, relheight = 0.05)
             Button(frame, text = 'Quit Room', command = click_quit_room).place(relx = 0.1, rely = 0.9, relwidth = 0.3, relheight = 0.05)
-            frame.after(1000, refresh)
+            if data['hostname'] == self.client.username:
+                Button(frame, text = 'Add Bot', command = click_add_bot).place(relx = 0.6, rely = 0.9, relwidth = 0.3, relheight = 0.05)
         refresh()
 
 
-    def game_page(self):
+    def game_page(self, meta_data = None):
+        if meta_data is None:
+            def on_meta_data(status_code, response):
+                if status_code != 200:
+                    self.Error_page(status_code, response)
+                else:
+                    self.game_page(response)
+            self.request(self.client.get_game_meta_data, (), on_meta_data)
+            return
         frame = Frame(self.root)
         frame.place(relx = 0, rely = 0, relwidth = 1, relheight = 1)
-        status_code, meta_data = self.client.get_game_meta_data()
-        if status_code != 200:
-            self.Error_page(status_code, meta_data)
+        self.enter_page('room')
 
         player_num = meta_data['player_num']
         players_thumbnails = []
@@ -308,10 +458,13 @@ class ClientGUI:
         top_card = Label(frame)
         top_card.place(relx = 0.425, rely = 0.25, relwidth = 0.15, relheight = 0.2)
 
+        #The actions are sent as batch requests, which bring back the new game state in the same round trip
         def skip():
+            self.request(self.client.batch, ([{'action': 'skip_card'}],), on_skipped)
+
+        def on_skipped(status_code, response):
             nonlocal choice
-            status_code, response = self.client.skip_card()
-            if status_code != 200:
+            if status_code != 200 or response['results'][-1]['error'] is not None:
                 return
             else:
                 draw_button.config(text = 'draw', command = draw_card)
@@ -321,13 +474,17 @@ class ClientGUI:
                     choice = None
                 draw_button.place_forget()
                 play_button.place_forget()
+                show_state(response['game'])
 
         def draw_card():
-            status_code, response = self.client.draw_card()
-            if status_code != 200:
+            self.request(self.client.batch, ([{'action': 'draw_card'}],), on_drew)
+
+        def on_drew(status_code, response):
+            if status_code != 200 or response['results'][-1]['error'] is not None:
                 return
             else:
                 draw_button.config(text = 'skip', command = skip)
+                show_state(response['game'])
 
         def play_card():
             nonlocal choice
@@ -339,7 +496,8 @@ class ClientGUI:
                 destroy_color_choice()
             else:
                 wild_color = color_choice if card.color in WILD_LIST else None
-                status_code, response = self.client.play_card(card.color, card.symbol, wild_color)
+                action = {'action': 'play_card', 'color': card.color, 'symbol': card.symbol, 'wild_color': wild_color}
+                self.request(self.client.batch, ([action],), on_played)
                 choice = None
                 play_button['state'] = 'disable'
                 draw_button.config(text = 'draw', command = draw_card)
@@ -347,6 +505,10 @@ class ClientGUI:
                 draw_button.place_forget()
                 play_button.place_forget()
 
+        def on_played(status_code, response):
+            if status_code == 200:
+                show_state(response['game'])
+
         draw_button = Button(frame, text = 'draw', command = draw_card)
         play_button = Button(frame, text = 'play card', command = play_card)       
         play_button['state'] = 'disable'
@@ -354,14 +516,27 @@ class ClientGUI:
         color_choices, color_choice = [], None
         data, prev_data = None, {}
         def refresh():
-            nonlocal data, prev_data
+            self.request(self.client.get_game_info, (), on_game_info, key = 'game_info')
+
+        def on_game_info(status_code, response):
+            if status_code is None:
+                self.after_page(1000, refresh)
+                return
             log_with_timestamp("Refreshed Game")
-            status_code, data = self.client.get_game_info()
-            if status_code != 200:
+            if status_code not in (200, 304):
                 frame.destroy()
-                self.Error_page(status_code, data)
+                self.Error_page(status_code, response)
                 return 
+            if show_state(response):
+                self.wait_update('room', refresh)
+
+        def show_state(state):
+            #Returns False if the game ended and the page was left
+            nonlocal data, prev_data
+            data = state
             if data['player_colors'][index_offset] != 'green':
+                #The turn may have ended without a skip from this page, when the server skipped a player taking too long
+                draw_button.config(text = 'draw', command = draw_card)
                 draw_button.place_forget()
                 play_button.place_forget()
             else:
@@ -372,7 +547,7 @@ class ClientGUI:
                     frame.destroy()
                     messagebox.showinfo("Result", data['result'])
                     self.root.after(30, self.room_page)
-                    return
+                    return False
                 if data['player_colors'] != prev_data.get('player_colors', None):
                     for i in range(player_num):
                         players_thumbnails[i].config(bg = COLOR[data['player_colors'][real_i(i)]])
@@ -382,36 +557,33 @@ class ClientGUI:
                 if data['top_card'] != prev_data.get('top_card', None):
                     top_card.color = data['top_card'][0]
                     top_card.symbol = data['top_card'][1]
-                    top_card.image = ImageTk.PhotoImage(IMAGE_DICT[top_card.color + top_card.symbol])
-                    top_card.config(image = top_card.image)
+                    set_image(top_card, top_card.color + top_card.symbol, card_size())
                 if data['cards'] != prev_data.get('cards', None):
-                    for card in cards:
-                        card.destroy()
                     gen_cards(data['cards'])
             prev_data = data
-            check_resize()
-            frame.after(1000, refresh)
-
-        def check_resize():
-            self.root.update()
-            size = (int(frame.winfo_width()*0.15), int(frame.winfo_height()*0.2))
-            def helper(card):
-                if card.size != size:
-                    name = card.color + card.symbol
-                    IMAGE_DICT[name] = IMAGE_DICT[name].resize(size, Image.ANTIALIAS)
-                    card.image = ImageTk.PhotoImage(IMAGE_DICT[name])
-                    card.config(image = card.image)
-            helper(top_card)
-            for card in cards:
-                helper(card)
-
-            size = (int(frame.winfo_width()*0.03), int(frame.winfo_height()*0.03))
+            return True
+
+        def card_size():
+            return (max(1, int(frame.winfo_width()*0.15)), max(1, int(frame.winfo_height()*0.2)))
+
+        def color_size():
+            return (max(1, int(frame.winfo_width()*0.03)), max(1, int(frame.winfo_height()*0.03)))
+
+        def set_image(widget, name, size):
+            widget.image = self.images.get(name, size)
+            widget.image_size = size
+            widget.config(image = widget.image)
+
+        def on_resize(event):
+            size = card_size()
+            for card in [top_card] + cards:
+                if hasattr(card, 'color') and card.image_size != size:
+                    set_image(card, card.color + card.symbol, size)
+            size = color_size()
             for color in color_choices:
-                if color.size != size:
-                    name = color.color
-                    IMAGE_DICT[name] = IMAGE_DICT[name].resize(size, Image.ANTIALIAS)
-                    color.image = ImageTk.PhotoImage(IMAGE_DICT[name])
-                    color.config(image = color.image)
+                if color.image_size != size:
+                    set_image(color, color.color, size)
+        frame.bind('<Configure>', on_resize)
 
         def make_choice(button):
             nonlocal color_choice
@@ -427,35 +599,15 @@ class ClientGUI:
       
         def built_color_choice():
             nonlocal color_choices
-            image = ImageTk.PhotoImage(IMAGE_DICT['Red'])
-            red_button = Button(frame, image = image)
-            red_button.image = image
-            red_button.color = 'Red'
-            red_button.place(relx = 0.62, rely = 0.3, relwidth = 0.03, relheight = 0.03)
-            red_button.config(command = lambda: make_choice(red_button))
-
-            image = ImageTk.PhotoImage(IMAGE_DICT['Yellow'])
-            yellow_button = Button(frame, image = image)
-            yellow_button.image = image
-            yellow_button.color = 'Yellow'
-            yellow_button.place(relx = 0.62, rely = 0.35, relwidth = 0.03, relheight = 0.03)
-            yellow_button.config(command = lambda: make_choice(yellow_button))
-            
-            image = ImageTk.PhotoImage(IMAGE_DICT['Blue'])
-            blue_button = Button(frame, image = image)
-            blue_button.image = image
-            blue_button.color = 'Blue'
-            blue_button.place(relx = 0.62, rely = 0.4, relwidth = 0.03, relheight = 0.03)
-            blue_button.config(command = lambda: make_choice(blue_button))
-
-            image = ImageTk.PhotoImage(IMAGE_DICT['Green'])
-            green_button = Button(frame, image = image)
-            green_button.image = image
-            green_button.color = 'Green'
-            green_button.place(relx = 0.62, rely = 0.45, relwidth = 0.03, relheight = 0.03)
-            green_button.config(command = lambda: make_choice(green_button))
-
-            color_choices = [red_button, yellow_button, blue_button, green_button]
+            color_choices = []
+            size = color_size()
+            for i in range(len(COLOR_LIST)):
+                button = Button(frame)
+                set_image(button, COLOR_LIST[i], size)
+                button.color = COLOR_LIST[i]
+                button.place(relx = 0.62, rely = 0.3 + i * 0.05, relwidth = 0.03, relheight = 0.03)
+                button.config(command = lambda button = button: make_choice(button))
+                color_choices.append(button)
             play_button['state'] = 'disable'
 
         def destroy_color_choice():
@@ -464,46 +616,72 @@ class ClientGUI:
                 color.destroy()
             color_choices, color_choice = [], None
 
+        def pop_card(i):
+            nonlocal choice
+            if choice is not None:
+                cards[choice].place(relx = cards[choice].relx, rely = 0.75, relwidth = 0.15, relheight = 0.2)
+                destroy_color_choice()
+            if choice == i:
+                choice = None
+                play_button['state'] = 'disable'
+            else:
+                cards[i].place(relx = cards[i].relx, rely = 0.65, relwidth = 0.15, relheight = 0.2)
+                choice = i
+                if cards[choice].color in WILD_LIST:
+                    built_color_choice()
+                else:
+                    play_button['state'] = 'normal'
+
+        #The card buttons of the hand, keyed by (color, symbol, n) where n tells apart the copies of the same card.
+        #Only the buttons of the cards that changed are touched, and the buttons of the played cards are reused
+        card_pool, spare_cards = {}, []
         def gen_cards(card_name_list):
             nonlocal cards, choice
             card_name_list = sort_str_card_list(card_name_list)
-            card_num = len(card_name_list)
-            total_space = 0.9 - card_num * 0.15
+            chosen = cards[choice] if choice is not None else None
+            keys, copies = [], {}
+            for color, symbol in card_name_list:
+                copies[(color, symbol)] = copies.get((color, symbol), -1) + 1
+                keys.append((color, symbol, copies[(color, symbol)]))
+            for key in set(card_pool) - set(keys):
+                button = card_pool.pop(key)
+                button.place_forget()
+                button.relx = None
+                spare_cards.append(button)
+
+            size = card_size()
             cards = []
-            choice = None
-            def pop_card(i):
-                nonlocal choice
-                if choice is not None:
-                    cards[choice].place(relx = cards[choice].relx, rely = 0.75, relwidth = 0.15, relheight = 0.2)
-                    destroy_color_choice()
-                if choice == i:
-                    choice = None
-                    play_button['state'] = 'disable'
+            for key in keys:
+                button = card_pool.get(key)
+                if button is None:
+                    button = spare_cards.pop() if spare_cards else Button(frame)
+                    button.color, button.symbol, button.relx = key[0], key[1], None
+                    set_image(button, button.color + button.symbol, size)
+                    card_pool[key] = button
+                button.config(command = lambda i = len(cards): pop_card(i))
+                cards.append(button)
+
+            if chosen in cards:
+                choice = cards.index(chosen)
+            elif choice is not None:
+                choice = None
+                play_button['state'] = 'disable'
+                destroy_color_choice()
+
+            card_num = len(cards)
+            total_space = 0.9 - card_num * 0.15
+            for i in range(card_num):
+                if total_space > 0:
+                    space = total_space / (card_num + 1)
+                    relx = 0.05 + i * (0.15 + space) + space
                 else:
-                    cards[i].place(relx = cards[i].relx, rely = 0.65, relwidth = 0.15, relheight = 0.2)
-                    choice = i
-                    if cards[choice].color in WILD_LIST:
-                        built_color_choice()
-                    else:
-                        play_button['state'] = 'normal'
-
-            def gen_card(i, relx, rely):
-                image = ImageTk.PhotoImage(IMAGE_DICT[card_name_list[i][0] + card_name_list[i][1]])
-                cards.append(Button(frame, image = image, command = lambda: pop_card(i)))
-                cards[i].place(relx = relx, rely = rely, relwidth = 0.15, relheight = 0.2)
-                cards[i].image = image
-                cards[i].color = card_name_list[i][0]
-                cards[i].symbol = card_name_list[i][1]
-                cards[i].relx = relx
-
-            if total_space > 0:
-                space = total_space / (card_num + 1)
-                for i in range(card_num):
-                    gen_card(i, 0.05 + i * (0.15 + space) + space, 0.75)
-            else:
-                space = total_space / (card_num - 1)
-                for i in range(card_num):
-                    gen_card(i, 0.05 + i * (0.15 + space), 0.75)
+                    space = total_space / (card_num - 1)
+                    relx = 0.05 + i * (0.15 + space)
+                rely = 0.65 if i == choice else 0.75
+                #A played card may have left its copy raised, so the height is checked as well
+                if cards[i].relx != relx or float(cards[i].place_info().get('rely', -1)) != rely:
+                    cards[i].relx = relx
+                    cards[i].place(relx = relx, rely = rely, relwidth = 0.15, relheight = 0.2)
         refresh()
 
 
@@ -519,12 +697,19 @@ class ClientGUI:
         Message(frame, text = str(status_code) + ": "+ str(response['error'])).place(relx = 0.25, rely = 0.25, relwidth = 0.5, relheight = 0.5)
  
 
+    def close(self):
+        self.exit()
+        self.root.destroy()
+
     def exit(self):
-        if self.client:
-            self.client.send_exit_signal()
+        if self.client and self.client.username and not self.exited:
+            self.exited = True
+            try:
+                self.client.send_exit_signal()
+            except Exception:
+                log_with_timestamp("Exit signal not sent")
 
 
 
 if __name__ == '__main__':
-    c = ClientGUI()
-    atexit.register(lambda: c.exit())
\ No newline at end of file
+    ClientGUI()
\ No newline at end of file
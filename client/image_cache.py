@@ -0,0 +1,28 @@
+"""
+image_cache.py
+This file handles the scaled card images of the GUI.
+The original images are never changed. Each (image name, size) pair is scaled and turned into a PhotoImage once,
+then shared by every widget showing that image at that size.
+"""
+from collections import OrderedDict
+from PIL import ImageTk, Image
+
+
+class ImageCache:
+    MAX_SIZES = 2 #Sizes kept for each image. The least recently used size is dropped, for example after a window resize
+
+    def __init__(self, originals):
+        #originals maps an image name such as 'Red7' or 'Blue' to its original PIL image
+        self.originals = originals
+        self.photos = {}
+
+    def get(self, name, size):
+        sizes = self.photos.setdefault(name, OrderedDict())
+        if size in sizes:
+            sizes.move_to_end(size)
+            return sizes[size]
+        photo = ImageTk.PhotoImage(self.originals[name].resize(size, Image.LANCZOS))
+        sizes[size] = photo
+        while len(sizes) > self.MAX_SIZES:
+            sizes.popitem(last = False)
+        return photo
@@ -0,0 +1,539 @@
+"""
+api.py
+This file handles the requests of the server api, independent of the web framework serving it.
+Every function takes the request form and returns a tuple (response data, status code), plus the ETag of the
+returned state for the versioned requests. A 304 status code comes with None as the response data.
+"""
+import json
+import secrets
+import zlib
+from room import *
+from patch import *
+from lobby import *
+from bot import *
+from sweeper import *
+from matchmaking import *
+
+#Seconds a wait_update request is held open before it returns without a change
+LONG_POLL_TIMEOUT = 25
+#Actions a batch request may hold
+MAX_BATCH_ACTIONS = 8
+
+def bearer_token(authorization):
+	#The session token of an 'Authorization: Bearer <token>' header, None without one
+	scheme, _, token = str(authorization or '').partition(' ')
+	return token.strip() if scheme.lower() == 'bearer' and token.strip() else None
+
+def wants_compact(form):
+	return str(form.get('compact', '')).lower() in ('1', 'true')
+
+def test_connection():
+	return {"error": None}, 200
+
+"""
+Stats Return Type:
+{'users': int of users of this server, bots included
+'bots': int of bots
+'rooms': int of open rooms
+'games': int of games being played
+'match_queue': int of users waiting for a quick match
+'room_capacity': int of rooms the server can hold
+'scheduled': int of callbacks waiting in the scheduler (turn timers and the sweeper)
+'sweeps', 'users_expired', 'rooms_closed', 'games_reclaimed': int counts of the sweeper since the server started, see sweeper.py
+}
+"""
+def stats():
+	with REGISTRY_LOCK:
+		users = list(USER_DICT.values())
+		ret_data = {'users': len(users), 'bots': len([user for user in users if user.bot]), 'rooms': len(ROOM_REGISTRY),
+			'games': len(ROOM_REGISTRY.in_game), 'room_capacity': ROOM_REGISTRY.capacity, 'scheduled': len(SCHEDULER)}
+	ret_data['match_queue'] = sum(waiting_count(players) for players in MATCH_BUCKETS)
+	for key in ['sweeps', 'users_expired', 'rooms_closed', 'games_reclaimed']:
+		ret_data[key] = SWEEP_STATS[key]
+	return ret_data, 200
+
+"""
+Create Username Return Type:
+{'token': str session token of the user
+'error': None
+}
+Every other request of the user carries the token, in an 'Authorization: Bearer <token>' header
+(server.py and asgi_server.py put it in the form as 'token'), or as the token parameter of the WebSocket url.
+"""
+def create_username(form):
+	if 'username' not in form:
+		return {"error": "No username in the request"}, 400
+	username = str(form['username'])
+	token = secrets.token_urlsafe(24)
+	with REGISTRY_LOCK:
+		if len(username) < 3:
+			return {"error": "Username has to contain at least three characters"}, 403
+		elif username in USERNAME_SET or not STORE.reserve_username(username, token):
+			return {"error": "Username is already taken"}, 403
+		else:
+			User(username, token)
+			return {'token': token, 'error': None}, 200
+
+def change_username(form):
+	if 'token' not in form or 'new_username' not in form:
+		return {"error":"Bad request"}, 400
+	try:
+		user = get_session(str(form['token']))
+		username = str(form['new_username'])
+		if user.room is not None and user.room.inGame:
+			return {"error": "Cannot change the username during a game"}, 400
+		with REGISTRY_LOCK:
+			if len(username) < 3:
+				return {"error": "Username has to contain at least three characters"}, 403
+			elif username in USERNAME_SET or not STORE.reserve_username(username, user.token):
+				return {"error":"Username is already taken"}, 403
+		#The room of the user is updated outside REGISTRY_LOCK, see room.py
+		user.change_username(username)
+		return {'error': None}, 200
+	except Exception as e:
+		return {'error': str(e)}, 400
+
+def create_room(form):
+	if 'token' not in form:
+		return {"error":"No session token in the request"}, 400
+	try:
+		user = get_session(str(form['token']))
+		room = Room(user.username)
+		return {'room_number': room.room_number, 'hostname': room.hostname, 'error': None}, 200
+	except Exception as e:
+		return {'error': str(e)}, 400
+
+def add_bot(form):
+	#The host fills a seat of the room with a bot
+	if 'token' not in form:
+		return {"error":"Bad request"}, 400
+	try:
+		user = get_session(str(form['token']))
+		room = user.room
+		with room.lock:
+			if user is not room.hostuser:
+				return {'error': 'You are not the host. Cannot add a bot!'}, 400
+			bot = Bot()
+			try:
+				bot.join_room(room)
+			except Exception:
+				bot.release()
+				raise
+		return {'bot_name': bot.username, 'error': None}, 200
+	except Exception as e:
+		return {'error': str(e)}, 400
+
+def remove_bot(form):
+	if 'token' not in form or 'bot_name' not in form:
+		return {"error":"Bad request"}, 400
+	try:
+		user = get_session(str(form['token']))
+		room = user.room
+		with room.lock:
+			if user is not room.hostuser:
+				return {'error': 'You are not the host. Cannot remove a bot!'}, 400
+			bots = [other for other in room.userlist if other.bot and other.username == str(form['bot_name'])]
+			if not bots:
+				return {'error': 'No such bot in the room'}, 400
+			if room.inGame:
+				return {'error': 'Game already started'}, 400
+			room.quit_user(bots[0])
+			bots[0].release()
+		return {'error': None}, 200
+	except Exception as e:
+		return {'error': str(e)}, 400
+
+"""
+Lobby Info Return Type:
+{room_number: {'user_number': int, 'hostname': str, 'inGame': boolean} for every room}
+The query may filter the rooms with 'waiting' (1 for the rooms not in game), 'free_seats' (1 for the rooms not full)
+and 'host' (prefix of the hostname). With a 'page' (from 1) and a 'page_size' (LOBBY_PAGE_SIZE by default) it returns one page:
+{'rooms': {room_number: {'user_number': int, 'hostname': str, 'inGame': boolean} for the rooms of the page}
+'page': int of the page returned, the last one if the asked page is past the end
+'page_count': int of pages, at least 1
+'room_count': int of rooms matching the filters
+}
+"""
+def lobby_info(client_etag = None, query = None):
+	query = query if query is not None else {}
+	try:
+		waiting = str(query.get('waiting', '')).lower() in ('1', 'true')
+		free_seats = str(query.get('free_seats', '')).lower() in ('1', 'true')
+		host = str(query.get('host', ''))
+		page = int(query['page']) if 'page' in query else None
+		page_size = min(max(int(query.get('page_size', LOBBY_PAGE_SIZE)), 1), MAX_LOBBY_PAGE_SIZE)
+	except ValueError:
+		return {"error":"Bad request"}, 400
+	version = STORE.get_lobby_version()
+	filters = (waiting, free_seats, host, page, page_size if page is not None else None)
+	#The ETag holds the query, so a client asking for another page or filter never gets a 304 for the previous one,
+	#and the epoch of the run, since a MemoryStore counts the versions from 0 again after a restart
+	etag = ETAG_EPOCH + '-' + str(version)
+	if filters != (False, False, '', None, None):
+		etag += '-' + format(zlib.crc32(repr(filters).encode()), 'x')
+	if client_etag == etag:
+		return None, 304, etag
+	snapshot = lobby_snapshot(version)
+	room_numbers = snapshot.select(waiting, free_seats, host)
+	if page is None:
+		return snapshot.rooms(room_numbers), 200, etag
+	page_count = max((len(room_numbers) + page_size - 1) // page_size, 1)
+	page = min(max(page, 1), page_count)
+	return {'rooms': snapshot.rooms(room_numbers[(page - 1) * page_size : page * page_size]), 'page': page,
+		'page_count': page_count, 'room_count': len(room_numbers)}, 200, etag
+
+"""
+Quick Match Return Type:
+{'room_number': int of the room the user is seated in, None while waiting
+'players': int of players of the game the user waits for, None if not waiting
+'waiting': int of users waiting for a game of that many players
+'error': None
+}
+quick_match puts the user in the queue for a game of 'players' players (DEFAULT_MATCH_PLAYERS if not given).
+When enough users wait, they are seated in a new room and the game starts, which changes the lobby:
+a waiting client calls wait_update on the 'lobby' channel, then match_status.
+"""
+def quick_match(form):
+	if 'token' not in form:
+		return {"error":"Bad request"}, 400
+	try:
+		user = get_session(str(form['token']))
+		players = int(form.get('players', DEFAULT_MATCH_PLAYERS))
+		if players not in MATCH_BUCKETS:
+			return {'error': 'A game has ' + str(MIN_MATCH_PLAYERS) + ' to ' + str(Room.MAX_PLAYER) + ' players'}, 400
+		if user.room is not None:
+			return {'error': 'Already in a room'}, 400
+		matched = enqueue(user, players)
+		if matched is not None:
+			try:
+				seat(matched)
+			except Exception:
+				requeue(matched, players)
+				raise
+		return match_info(user), 200
+	except Exception as e:
+		return {'error': str(e)}, 400
+
+def match_status(form):
+	if 'token' not in form:
+		return {"error":"Bad request"}, 400
+	try:
+		return match_info(get_session(str(form['token']))), 200
+	except Exception as e:
+		return {'error': str(e)}, 400
+
+def cancel_match(form):
+	if 'token' not in form:
+		return {"error":"Bad request"}, 400
+	try:
+		if not dequeue(get_session(str(form['token']))):
+			return {'error': 'Not waiting for a match'}, 400
+		return {'error': None}, 200
+	except Exception as e:
+		return {'error': str(e)}, 400
+
+def match_info(user):
+	players = user.match_players
+	return {'room_number': user.room.room_number if user.room is not None else None, 'players': players,
+		'waiting': waiting_count(players) if players is not None else 0, 'error': None}
+
+def join_room(form):
+	if 'token' not in form or 'room_number' not in form:
+		return {"error":"Bad request"}, 400
+	try:
+		user = get_session(str(form['token']))
+		room_number = int(form['room_number'])
+		if room_shard(room_number) != SHARD_INDEX:
+			return {'error': 'Room is served by another server', 'server_url': SHARD_URLS[room_shard(room_number)]}, 421
+		room = ROOM_DICT[room_number]
+		user.join_room(room)
+		return {'error': None}, 200
+	except Exception as e:
+		return {'error': str(e)}, 400
+
+def quit_room(form):
+	if 'token' not in form:
+		return {"error":"Bad request"}, 400
+	try:
+		user = get_session(str(form['token']))
+		user.quit_room()
+		return {'error': None}, 200
+	except Exception as e:
+		return {'error': str(e)}, 400
+
+"""
+lobby_info, room_info and game_info are versioned. The response carries an ETag of the state version,
+and a request whose If-None-Match header holds the current ETag gets an empty 304 response instead.
+"""
+
+"""
+Room Info Return Type:
+{'room_number': int value of the room number
+'user_number': int value of number of players in room
+'hostname': str name of the host player
+'inGame': boolean value shows if the game started
+'bots': list of the usernames of the bots in the room
+'user_info': dict of the user infos
+	{
+	'0': (str name of the user at index 0, boolean value shows if ready)
+	'1': (str name of the user at index 1, boolean value shows if ready)
+	}
+}
+"""
+def room_info(form, client_etag = None):
+	if 'token' not in form:
+		return {"error":"Bad request"}, 400
+	try:
+		room = get_session(str(form['token'])).room
+		with room.lock:
+			etag = room.etag()
+			if client_etag == etag:
+				return None, 304, etag
+			room_info = room.get_room_info()
+		return room_info, 200, etag
+	except Exception as e:
+		return {'error': str(e)}, 400
+
+def start_game(form):
+	if 'token' not in form:
+		return {"error":"Bad request"}, 400
+	try:
+		user = get_session(str(form['token']))
+		room = user.room
+		with room.lock:
+			if user is not room.hostuser:
+				return {'error': 'You are not the host. Cannot start the game!'}, 400
+			elif len(room.userlist) < 2:
+				return {'error': 'Need at least 2 players to start the game!'}, 400
+			elif not all([u.ready or u is room.hostuser for u in room.userlist]):
+				return {'error': 'Player not ready!'}, 400
+			else:
+				room.start_game()
+				return {'error': None}, 200
+	except Exception as e:
+		return {'error': str(e)}, 400
+
+def user_ready(form):
+	if 'token' not in form:
+		return {"error":"Bad request"}, 400
+	try:
+		user = get_session(str(form['token']))
+		user.room.toggle_ready(user)
+		return {'error': None}, 200
+	except Exception as e:
+		return {'error': str(e)}, 400
+
+"""
+Game Info Return Type:
+{'game_end': Boolean value indicate if the game ends
+'current_player': current player's username
+'next_player': next player's username
+'top_card': tuple(card color, card symbol)
+'cards': list of the cards the user has. [tuple(card color, card symbol), tuple(card color, card symbol)...]
+'player_colors': list of str of colors for all players
+'player_card_nums': list of int of cards left for all players
+}
+With 'compact' set in the request form, the cards are sent in the compact format of patch.py
+"""
+def game_info(form, client_etag = None):
+	if 'token' not in form:
+		return {"error":"Bad request"}, 400
+	try:
+		user = get_session(str(form['token']))
+		room = user.room
+		with room.lock:
+			if not room.inGame and room.game is None:
+				return {'error': 'Game not yet started'}, 400
+			etag = room.etag()
+			if client_etag == etag:
+				return None, 304, etag
+			state = room.get_game_info(user)
+		return (compact_state(state) if wants_compact(form) else state), 200, etag
+	except Exception as e:
+		return {'error': str(e)}, 400
+
+"""
+Game Patch Return Type:
+{'version': str ETag of the game state the patch leads to, send it back as 'version' in the next request
+'full': Boolean value. True if 'state' holds the whole game state (same type as game_info) instead of a patch
+'state': the whole game state, only when 'full' is True
+'patch': the changes since the requested version, only when 'full' is False. See patch.py for the type
+}
+A 304 response is returned if nothing changed since the requested version.
+With 'compact' set in the request form, the state or the patch is sent in the compact format of patch.py
+"""
+def game_patch(form):
+	if 'token' not in form:
+		return {"error":"Bad request"}, 400
+	try:
+		user = get_session(str(form['token']))
+		room = user.room
+		with room.lock:
+			if not room.inGame and room.game is None:
+				return {'error': 'Game not yet started'}, 400
+			etag = room.etag()
+			version = form.get('version')
+			if version == etag:
+				return None, 304, etag
+			state = room.get_game_info(user)
+		return patch_since(user, version, state, etag, wants_compact(form)), 200, etag
+	except Exception as e:
+		return {'error': str(e)}, 400
+
+def patch_since(user, version, state, etag, compact):
+	#The game patch response leading from the version to the state, the whole state if the version is not the last one sent
+	sent_state = user.sent_game_state
+	user.sent_game_state = (etag, state)
+	if sent_state is None or sent_state[0] != version or not patchable(sent_state[1], state):
+		return {'version': etag, 'full': True, 'state': compact_state(state) if compact else state}
+	patch = make_patch(sent_state[1], state)
+	return {'version': etag, 'full': False, 'patch': compact_patch(patch) if compact else patch}
+
+def patchable(old_state, new_state):
+	#A patch can not remove a field or shorten the player lists
+	return old_state.keys() == new_state.keys() and all(len(old_state[key]) == len(new_state[key]) for key in LIST_FIELDS)
+
+"""
+Batch Return Type:
+{'results': list of {'action': str name of the action, 'error': None or str error of the action} for the actions run
+'game': the game patch since 'version' (same type as the game_patch response), None if the game did not change since then
+'error': None
+}
+The form holds 'actions', a JSON list (or a list in a WebSocket command) of the actions of the user to run in order:
+	{'action': 'play_card', 'color': str, 'symbol': str, 'wild_color': str or None}, {'action': 'draw_card'} or {'action': 'skip_card'}
+plus the 'version' and 'compact' fields of game_patch. The actions run while holding the room lock, so no other request
+changes the game between them, and they stop at the first one failing. The actions run before it stay done.
+A turn such as draw then skip, or play then fetch the state, is one request.
+"""
+def batch(form):
+	if 'token' not in form or 'actions' not in form:
+		return {"error":"Bad request"}, 400
+	try:
+		#A WebSocket command can hold the list itself
+		actions = form['actions'] if isinstance(form['actions'], list) else json.loads(str(form['actions']))
+	except ValueError:
+		return {"error":"Bad request"}, 400
+	if not isinstance(actions, list) or len(actions) > MAX_BATCH_ACTIONS or \
+		not all(isinstance(action, dict) and isinstance(action.get('action'), str) and action['action'] in BATCH_ACTIONS and
+			all(field in action for field in BATCH_ACTIONS[action['action']][1]) for action in actions):
+		return {"error":"Bad actions"}, 400
+	try:
+		user = get_session(str(form['token']))
+		room = user.room
+		results = []
+		with room.lock:
+			if not room.inGame and room.game is None:
+				return {'error': 'Game not yet started'}, 400
+			for action in actions:
+				try:
+					BATCH_ACTIONS[action['action']][0](room, user, action)
+					results.append({'action': action['action'], 'error': None})
+				except Exception as e:
+					results.append({'action': action['action'], 'error': str(e)})
+					break
+			etag = room.etag()
+			version = form.get('version')
+			game = patch_since(user, version, room.get_game_info(user), etag, wants_compact(form)) if version != etag else None
+		return {'results': results, 'game': game, 'error': None}, 200
+	except Exception as e:
+		return {'error': str(e)}, 400
+
+def batch_play_card(room, user, action):
+	wild_color = str(action['wild_color']) if action.get('wild_color') is not None else None
+	room.play_card(user.player, str(action['color']), str(action['symbol']), wild_color)
+
+#Action name: (function running the action, fields the action must have)
+BATCH_ACTIONS = {'play_card': (batch_play_card, ['color', 'symbol']), 'draw_card': (lambda room, user, action: room.draw_card(user.player), []),
+	'skip_card': (lambda room, user, action: room.skip_card(user.player), [])}
+
+"""
+Meta Data Return Type:
+{'player_num': int of total players in the room
+'index': int of the requested user's index
+'0': Username at index 0
+'1': Username at index 1
+...
+}
+"""
+def game_meta_data(form):
+	if 'token' not in form:
+		return {"error":"Bad request"}, 400
+	try:
+		user = get_session(str(form['token']))
+		ret_data = {}
+		with user.room.lock:
+			player_list = list(user.room.game.player_list)
+		for i in range(len(player_list)):
+			ret_data[str(i)] = (player_list[i].user.username)
+		ret_data['player_num'] = len(player_list)
+		ret_data['index'] = user.player.index
+		return ret_data, 200
+	except Exception as e:
+		return {'error': str(e)}, 400
+
+def play_card(form):
+	if 'token' not in form:
+		return {"error":"Bad request"}, 400
+	try:
+		user = get_session(str(form['token']))
+		if 'wild_color' in form:
+			wild_color = str(form['wild_color'])
+		else:
+			wild_color = None
+		user.room.play_card(user.player, str(form['color']), str(form['symbol']), wild_color)
+		return {'error': None}, 200
+	except Exception as e:
+		return {'error': str(e)}, 400
+
+def draw_card(form):
+	if 'token' not in form:
+		return {"error":"Bad request"}, 400
+	try:
+		user = get_session(str(form['token']))
+		user.room.draw_card(user.player)
+		return {'error': None}, 200
+	except Exception as e:
+		return {'error': str(e)}, 400
+
+def skip_card(form):
+	if 'token' not in form:
+		return {"error":"Bad request"}, 400
+	try:
+		user = get_session(str(form['token']))
+		user.room.skip_card(user.player)
+		return {'error': None}, 200
+	except Exception as e:
+		return {'error': str(e)}, 400
+
+
+"""
+Wait Update Return Type:
+{'version': int of the current version of the channel, it differs from the requested one if something changed
+'error': None
+}
+The request blocks until the channel ('lobby' or 'room') changes or LONG_POLL_TIMEOUT seconds passed.
+The 'room' channel also covers the game played in the room.
+"""
+def wait_update(form):
+	if 'token' not in form or 'channel' not in form:
+		return {"error":"Bad request"}, 400
+	try:
+		user = get_session(str(form['token']))
+		version = int(form.get('version', -1))
+		if form['channel'] == 'lobby':
+			return {'version': wait_lobby_version(version, LONG_POLL_TIMEOUT), 'error': None}, 200
+		elif form['channel'] == 'room':
+			return {'version': user.room.notifier.wait(version, LONG_POLL_TIMEOUT), 'error': None}, 200
+		else:
+			return {"error":"Unknown channel"}, 400
+	except Exception as e:
+		return {'error': str(e)}, 400
+
+def exit_signal(form):
+	if 'token' not in form:
+		return {"error":"No session token in the request"}, 400
+	try:
+		get_session(str(form['token'])).clean_up()
+		return {'error': None}, 200
+	except Exception as e:
+		return {'error': str(e)}, 400
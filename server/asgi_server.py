@@ -0,0 +1,233 @@
+"""
+asgi_server.py
+The asyncio server of the game. It serves the same api as server.py on an ASGI server, so idle long-polls only cost
+a coroutine instead of a thread, and adds a WebSocket game session at /api/ws.
+To start the server on local, run command 'python3 asgi_server.py' (or 'uvicorn asgi_server:app')
+
+WebSocket session:
+Connect to /api/ws?token=<session token>, optionally with the page and filters of the lobby pushes (see lobby_info in api.py). Every message sent by the client is a command:
+	{'action': name of an api request such as 'play_card', 'id': optional value echoed in the reply, plus the request form fields}
+and is answered with {'id': id of the command, 'action': action, 'status': int status code, 'data': the api response}.
+The command {'action': 'lobby_info', plus the page and filters} changes the lobby page pushed to the session.
+The server also pushes the state whenever it changes:
+	{'push': 'lobby', 'data': lobby info} while the user is not in a room
+	{'push': 'room', 'data': room info} and {'push': 'game', 'data': game patch} while the user is in a room
+"""
+import asyncio
+import json
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+import api
+from room import *
+
+#The api.py functions wait for the room locks and for the store, which may write to SQLite, so they are run in the thread pool
+#instead of on the event loop, where they would hold up every other connection.
+#The api requests taking the request form only. They can also be sent as WebSocket commands
+FORM_REQUESTS = {'create_username': api.create_username, 'change_username': api.change_username, 'create_room': api.create_room,
+	'add_bot': api.add_bot, 'remove_bot': api.remove_bot, 'quick_match': api.quick_match, 'match_status': api.match_status,
+	'cancel_match': api.cancel_match, 'join_room': api.join_room, 'quit_room': api.quit_room, 'start_game': api.start_game, 'user_ready': api.user_ready,
+	'game_patch': api.game_patch, 'game_meta_data': api.game_meta_data, 'play_card': api.play_card, 'draw_card': api.draw_card,
+	'skip_card': api.skip_card, 'batch': api.batch, 'exit_signal': api.exit_signal}
+
+
+def respond(result):
+	#Turn the (response data, status code[, etag]) tuple returned by api.py into a Starlette response
+	headers = {'ETag': '"' + result[2] + '"'} if len(result) > 2 else None
+	if result[1] == 304:
+		return Response(status_code = 304, headers = headers)
+	return JSONResponse(result[0], status_code = result[1], headers = headers)
+
+def client_etag(request):
+	etag = request.headers.get('if-none-match')
+	return etag.split(',')[0].strip().strip('"') if etag else None
+
+async def wait_for_change(notifier, version, timeout):
+	#Same as Notifier.wait, without blocking the event loop
+	loop = asyncio.get_running_loop()
+	changed = asyncio.Event()
+	listener = lambda new_version: loop.call_soon_threadsafe(changed.set)
+	notifier.add_listener(listener)
+	try:
+		if notifier.version == version:
+			await asyncio.wait_for(changed.wait(), timeout)
+	except asyncio.TimeoutError:
+		pass
+	finally:
+		notifier.remove_listener(listener)
+	return notifier.version
+
+async def wait_lobby_change(version, timeout):
+	if SHARD_COUNT == 1:
+		return await wait_for_change(LOBBY_NOTIFIER, version, timeout)
+	deadline = asyncio.get_running_loop().time() + timeout
+	while await run_in_threadpool(STORE.get_lobby_version) == version and asyncio.get_running_loop().time() < deadline:
+		await wait_for_change(LOBBY_NOTIFIER, LOBBY_NOTIFIER.version, 1)
+	return await run_in_threadpool(STORE.get_lobby_version)
+
+
+async def request_form(request):
+	#The request form, plus the session token of the Authorization header as 'token'
+	form = dict(await request.form())
+	token = api.bearer_token(request.headers.get('Authorization'))
+	if token is not None:
+		form['token'] = token
+	return form
+
+async def test_connection(request):
+	return respond(api.test_connection())
+
+async def stats(request):
+	return respond(await run_in_threadpool(api.stats))
+
+async def lobby_info(request):
+	return respond(await run_in_threadpool(api.lobby_info, client_etag(request), request.query_params))
+
+async def room_info(request):
+	return respond(await run_in_threadpool(api.room_info, await request_form(request), client_etag(request)))
+
+async def game_info(request):
+	return respond(await run_in_threadpool(api.game_info, await request_form(request), client_etag(request)))
+
+async def form_request(request):
+	if request.path_params['name'] not in FORM_REQUESTS:
+		return JSONResponse({"error":"Not found"}, status_code = 404)
+	return respond(await run_in_threadpool(FORM_REQUESTS[request.path_params['name']], await request_form(request)))
+
+async def wait_update(request):
+	form = await request_form(request)
+	if 'token' not in form or 'channel' not in form:
+		return JSONResponse({"error":"Bad request"}, status_code = 400)
+	try:
+		user = await run_in_threadpool(get_session, str(form['token']))
+		version = int(form.get('version', -1))
+		if form['channel'] == 'lobby':
+			return JSONResponse({'version': await wait_lobby_change(version, api.LONG_POLL_TIMEOUT), 'error': None})
+		elif form['channel'] == 'room':
+			return JSONResponse({'version': await wait_for_change(user.room.notifier, version, api.LONG_POLL_TIMEOUT), 'error': None})
+		else:
+			return JSONResponse({"error":"Unknown channel"}, status_code = 400)
+	except Exception as e:
+		return JSONResponse({'error': str(e)}, status_code = 400)
+
+
+class GameSession:
+	"""The WebSocket connection of one user. Commands are answered as they come, and the state is pushed
+	every time the lobby or the room of the user changes."""
+	def __init__(self, websocket, user):
+		self.websocket = websocket
+		self.user = user
+		self.changed = asyncio.Event()
+		self.loop = asyncio.get_running_loop()
+		self.room = None
+		self.lobby_etag, self.room_etag, self.game_version = None, None, None
+		self.lobby_query = {key: value for key, value in websocket.query_params.items() if key != 'token'}
+
+	def listener(self, version):
+		self.loop.call_soon_threadsafe(self.changed.set)
+
+	async def run(self):
+		#A user with an open session is never removed by the sweeper
+		self.user.sessions += 1
+		LOBBY_NOTIFIER.add_listener(self.listener)
+		pusher = asyncio.ensure_future(self.push_updates())
+		try:
+			while True:
+				await self.handle_command(await self.websocket.receive_json())
+		except (WebSocketDisconnect, json.JSONDecodeError):
+			pass
+		finally:
+			pusher.cancel()
+			LOBBY_NOTIFIER.remove_listener(self.listener)
+			self.follow_room(None)
+			self.user.sessions -= 1
+
+	async def handle_command(self, message):
+		if not isinstance(message, dict):
+			await self.websocket.send_json({'id': None, 'action': None, 'status': 400, 'data': {'error': 'A command is a JSON object'}})
+			return
+		action = message.pop('action', None)
+		if action == 'lobby_info':
+			self.lobby_query = {key: value for key, value in message.items() if key != 'id'}
+			result = await run_in_threadpool(api.lobby_info, None, self.lobby_query)
+			self.lobby_etag = result[2] if result[1] == 200 else None
+			await self.websocket.send_json({'id': message.get('id'), 'action': action, 'status': result[1], 'data': result[0]})
+			return
+		if action not in FORM_REQUESTS:
+			await self.websocket.send_json({'id': message.get('id'), 'action': action, 'status': 400, 'data': {'error': 'Unknown action'}})
+			return
+		form = dict(message)
+		form['token'] = self.user.token
+		result = await run_in_threadpool(FORM_REQUESTS[action], form)
+		await self.websocket.send_json({'id': message.get('id'), 'action': action, 'status': result[1], 'data': result[0]})
+		#The command may have moved the user to another room
+		self.changed.set()
+
+	def follow_room(self, room):
+		#Listen to the room the user is in
+		if room is self.room:
+			return
+		if self.room is not None:
+			self.room.notifier.remove_listener(self.listener)
+		self.room = room
+		if room is not None:
+			room.notifier.add_listener(self.listener)
+
+	async def push_updates(self):
+		self.changed.set()
+		while True:
+			await self.changed.wait()
+			self.changed.clear()
+			self.follow_room(self.user.room)
+			await self.push_state()
+
+	async def push_state(self):
+		form = {'token': self.user.token}
+		if self.room is None:
+			result = await run_in_threadpool(api.lobby_info, self.lobby_etag, self.lobby_query)
+			if result[1] == 200:
+				self.lobby_etag, data = result[2], result[0]
+				await self.websocket.send_json({'push': 'lobby', 'data': data})
+			return
+		result = await run_in_threadpool(api.room_info, form, self.room_etag)
+		if result[1] == 200:
+			self.room_etag = result[2]
+			await self.websocket.send_json({'push': 'room', 'data': result[0]})
+		if self.room.game is not None:
+			if self.game_version is not None:
+				form['version'] = self.game_version
+			result = await run_in_threadpool(api.game_patch, form)
+			if result[1] == 200:
+				self.game_version = result[2]
+				await self.websocket.send_json({'push': 'game', 'data': result[0]})
+
+
+async def game_session(websocket):
+	await websocket.accept()
+	#Browsers can not set headers on a WebSocket, the token can also be given in the url
+	token = websocket.query_params.get('token') or api.bearer_token(websocket.headers.get('Authorization'))
+	try:
+		user = await run_in_threadpool(get_session, str(token))
+	except SessionError:
+		await websocket.close(code = 4401)
+		return
+	await GameSession(websocket, user).run()
+
+
+app = Starlette(routes = [
+	Route('/api/test_connection', test_connection, methods = ['GET']),
+	Route('/api/stats', stats, methods = ['GET']),
+	Route('/api/lobby_info', lobby_info, methods = ['GET']),
+	Route('/api/room_info', room_info, methods = ['POST']),
+	Route('/api/game_info', game_info, methods = ['POST']),
+	Route('/api/wait_update', wait_update, methods = ['POST']),
+	Route('/api/{name:str}', form_request, methods = ['POST']),
+	WebSocketRoute('/api/ws', game_session),
+])
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, port = 5000)
@@ -0,0 +1,178 @@
+"""
+batch_simulation.py
+Many headless games played in lock-step with NumPy, for Monte Carlo statistics over a large number of games.
+The rules are the same as game.py and simulation.py, only the cards are counted instead of kept in order:
+a hand, the draw pile and the discard pile of each game are rows of counts per card type, and drawing a card picks one
+of the cards of the draw pile at random, which is the same as drawing from a shuffled pile.
+The policies are the ones of simulation.py, 'random' and 'greedy'.
+To get the game lengths by player count, run 'python3 batch_simulation.py --games 20000 --players 2-10'
+"""
+import numpy as np
+from cards import *
+from player import HAND_CODES
+from simulation import GREEDY_WEIGHT, MAX_TURNS, SimulationResult
+
+#Card types are the codes a card in a hand can have, numbered 0 to len(HAND_CODES) - 1. The top card is kept as its code,
+#since a played wild card takes a color
+TYPE_COUNT = len(HAND_CODES)
+TYPE_CODE = np.array(HAND_CODES)
+TYPE_COLOR = np.array([ALL_COLOR_LIST.index(code_color(code)) for code in HAND_CODES])
+TYPE_SYMBOL = np.array([ALL_SYMBOL_LIST.index(code_symbol(code)) for code in HAND_CODES])
+TYPE_WEIGHT = np.array([GREEDY_WEIGHT[code] for code in HAND_CODES], dtype = float)
+#CODE_TYPE[code] is the type a card goes back to when it is discarded, a played wild card loses its color
+CODE_TYPE = np.zeros(CODE_COUNT, dtype = int)
+for code in CARD_OF_CODE:
+	CODE_TYPE[code] = HAND_CODES.index(card_code("Wild", code_symbol(code)) if code_symbol(code) in WILD_SYMBOL_LIST else code)
+#TOP_PLAYABLE[top card code][type] is True if the type can be played on the top card, same as PLAYABLE in cards.py
+TOP_PLAYABLE = np.array([[PLAYABLE[top_code][code] for code in HAND_CODES] for top_code in range(CODE_COUNT)], dtype = bool)
+DECK_COUNTS = np.array([DECK_CODES.count(code) for code in HAND_CODES], dtype = np.int8)
+WILD = ALL_COLOR_LIST.index("Wild")
+REVERSE, SKIP, DRAW, DRAW4 = [ALL_SYMBOL_LIST.index(symbol) for symbol in ["R", "S", "D", "D4"]]
+COLOR_TYPES = np.array([[TYPE_COLOR[t] == color for t in range(TYPE_COUNT)] for color in range(len(COLOR_LIST))], dtype = np.int8).T
+
+
+class BatchSimulation:
+	"""The state of every game is a row of the arrays: the counts of each card type in the draw pile, the discard pile
+	and the hands of the players, the hand sizes, the top card code, the current player, the direction and the turns played"""
+	def __init__(self, policy_names, games, rng = None):
+		self.rng = rng if rng is not None else np.random.default_rng()
+		self.games = games
+		self.player_amount = len(policy_names)
+		self.greedy = np.array([name == 'greedy' for name in policy_names])
+		self.all_games = np.arange(games)
+		self.draw_pile = np.tile(DECK_COUNTS, (games, 1))
+		self.draw_size = np.full(games, len(DECK_CODES))
+		self.discard_pile = np.zeros((games, TYPE_COUNT), dtype = np.int8)
+		self.discard_size = np.zeros(games, dtype = int)
+		self.hands = np.zeros((games, self.player_amount, TYPE_COUNT), dtype = np.int8)
+		self.hand_sizes = np.zeros((games, self.player_amount), dtype = int)
+		for _ in range(7):
+			for player in range(self.player_amount):
+				self.draw(self.all_games, np.full(games, player))
+		self.top_code = TYPE_CODE[self.take_cards(self.all_games)[1]]
+		self.current = np.zeros(games, dtype = int)
+		self.direction = np.ones(games, dtype = int)
+		self.players_left = np.full(games, self.player_amount)
+		self.turns = np.zeros(games, dtype = int)
+		self.rank_lists = [[] for _ in range(games)]
+
+	def take_cards(self, games):
+		#Takes one random card out of the draw pile of each game, the discard pile is shuffled back into an empty draw pile.
+		#Returns the mask of the games that got a card and the card types
+		refill = games[self.draw_size[games] == 0]
+		self.draw_pile[refill] += self.discard_pile[refill]
+		self.draw_size[refill] += self.discard_size[refill]
+		self.discard_pile[refill] = 0
+		self.discard_size[refill] = 0
+		dealt = self.draw_size[games] > 0
+		games = games[dealt]
+		picks = self.rng.integers(0, self.draw_size[games])
+		types = (np.cumsum(self.draw_pile[games], 1) <= picks[:, None]).sum(1)
+		self.draw_pile[games, types] -= 1
+		self.draw_size[games] -= 1
+		return dealt, types
+
+	def draw(self, games, players):
+		#Deals a card to the given player of each game, if there is any left
+		dealt, types = self.take_cards(games)
+		games, players = games[dealt], players[dealt]
+		self.hands[games, players, types] += 1
+		self.hand_sizes[games, players] += 1
+
+	def playable(self, games):
+		#Mask of the card types the current player of each game holds and can play on the top card
+		return TOP_PLAYABLE[self.top_code[games]] & (self.hands[games, self.current[games]] > 0)
+
+	def choose(self, games, mask):
+		#The card type picked by the policy of the current player of each game
+		greedy = self.greedy[self.current[games]]
+		scores = np.where(greedy[:, None], TYPE_WEIGHT[None, :], self.rng.random(mask.shape))
+		return np.where(mask, scores, -np.inf).argmax(1)
+
+	def choose_color(self, games):
+		greedy = self.greedy[self.current[games]]
+		held = self.hands[games, self.current[games]] @ COLOR_TYPES
+		return np.where(greedy, held.argmax(1), self.rng.integers(0, len(COLOR_LIST), len(games)))
+
+	def next_player(self, games, current):
+		direction = self.direction[games]
+		ret = (current + direction) % self.player_amount
+		out = self.hand_sizes[games, ret] == 0
+		while out.any():
+			ret[out] = (ret[out] + direction[out]) % self.player_amount
+			out = self.hand_sizes[games, ret] == 0
+		return ret
+
+	def step(self, games):
+		#One turn of each of the given games
+		self.turns[games] += 1
+		mask = self.playable(games)
+		drawing = ~mask.any(1)
+		if drawing.any():
+			self.draw(games[drawing], self.current[games[drawing]])
+			mask[drawing] = self.playable(games[drawing])
+		playing = mask.any(1)
+		skipping = games[~playing]
+		self.current[skipping] = self.next_player(skipping, self.current[skipping])
+		games, mask = games[playing], mask[playing]
+		if len(games):
+			self.play(games, self.choose(games, mask))
+
+	def play(self, games, types):
+		players = self.current[games]
+		self.hands[games, players, types] -= 1
+		self.hand_sizes[games, players] -= 1
+		self.discard_pile[games, CODE_TYPE[self.top_code[games]]] += 1
+		self.discard_size[games] += 1
+		colors = TYPE_COLOR[types]
+		symbols = TYPE_SYMBOL[types]
+		wild = colors == WILD
+		colors[wild] = self.choose_color(games[wild])
+		self.top_code[games] = colors * 16 + symbols
+		self.direction[games[symbols == REVERSE]] *= -1
+		skip = games[symbols == SKIP]
+		self.current[skip] = self.next_player(skip, self.current[skip])
+		for symbol, amount in [(DRAW, 2), (DRAW4, 4)]:
+			victims = games[symbols == symbol]
+			victim_players = self.next_player(victims, self.current[victims])
+			for _ in range(amount):
+				self.draw(victims, victim_players)
+		finished = self.hand_sizes[games, players] == 0
+		for game, player in zip(games[finished], players[finished]):
+			self.rank_lists[game].append(int(player))
+		self.players_left[games[finished]] -= 1
+		self.current[games] = self.next_player(games, self.current[games])
+
+	def run(self, max_turns = MAX_TURNS):
+		#Plays every game to its end. Returns the rank list of each game, like SimulatedGame.run
+		active = self.all_games
+		while len(active):
+			self.step(active)
+			active = active[(self.players_left[active] > 1) & (self.turns[active] < max_turns)]
+		for game in self.all_games[self.players_left <= 1]:
+			self.rank_lists[game].extend(int(i) for i in np.flatnonzero(self.hand_sizes[game]))
+		return self.rank_lists
+
+
+def simulate_batch(policy_names, games, max_turns = MAX_TURNS, rng = None):
+	batch = BatchSimulation(policy_names, games, rng)
+	result = SimulationResult(policy_names)
+	for rank_list, turns in zip(batch.run(max_turns), batch.turns):
+		result.add(rank_list, int(turns))
+	return result
+
+
+if __name__ == '__main__':
+	import argparse
+	import time
+	parser = argparse.ArgumentParser(description = "Play headless games in lock-step batches")
+	parser.add_argument('--games', type = int, default = 10000, help = "Games for each player count")
+	parser.add_argument('--players', default = '2-10', help = "Player count, or range of player counts such as 2-10")
+	parser.add_argument('--policy', default = 'random', help = "Policy of every seat: random or greedy")
+	args = parser.parse_args()
+	low, _, high = args.players.partition('-')
+	for player_amount in range(int(low), int(high or low) + 1):
+		start = time.time()
+		result = simulate_batch([args.policy] * player_amount, args.games)
+		print(str(player_amount) + " players: " + result.report().replace("\n", "; ") + "; {:.0f} games per second".format(
+			result.games / (time.time() - start)))
@@ -0,0 +1,120 @@
+"""
+bot.py
+This file handles the bots of the server.
+A bot is a user added to a room by the host. It is always ready, and a bot also takes over the turns of a player leaving during a game.
+The turns of the bots are played in the server process by one background thread for all the rooms, through the same Room methods
+as the api requests. A bot looks at its playable cards for at most BOT_DECISION_BUDGET seconds per move.
+"""
+import time
+import traceback
+from itertools import count
+from queue import Queue
+from threading import Lock, Thread
+from room import *
+from simulation import GREEDY_WEIGHT
+
+BOT_DECISION_BUDGET = 0.01 #Seconds a bot may spend to choose a move
+BOT_NAME_NUMBERS = count(1)
+
+
+class Bot(User):
+	bot = True
+
+	def __init__(self):
+		#Bots are named "Bot 1", "Bot 2"... skipping the names already taken
+		with REGISTRY_LOCK:
+			username = "Bot " + str(next(BOT_NAME_NUMBERS))
+			while username in USERNAME_SET or not STORE.reserve_username(username):
+				username = "Bot " + str(next(BOT_NAME_NUMBERS))
+			User.__init__(self, username)
+		self.ready = True
+
+	def join_room(self, room):
+		room.join_user(self)
+
+	def release(self):
+		#Frees the username of a bot leaving its room
+		with REGISTRY_LOCK:
+			USER_DICT.pop(self.username, None)
+			USERNAME_SET.discard(self.username)
+			TOKEN_DICT.pop(self.token, None)
+		STORE.release_username(self.username)
+
+
+def choose_move(game, player, budget = BOT_DECISION_BUDGET):
+	"""The move of a bot: None to draw (or to skip after having drawn), or (color, symbol, wild color) of the card to play.
+	Playable cards are tried from the most hurtful for the next player, wild cards last, and a card scores higher
+	if it leaves more cards of the hand playable on it. The best card found before the budget runs out is played."""
+	deadline = time.perf_counter() + budget
+	hand = player.hands
+	wild_color = max(COLOR_LIST, key = lambda color: sum(hand.counts[card_code(color, symbol)] for symbol in SYMBOL_LIST))
+	best, best_score = None, None
+	for code in sorted(hand.playable_codes(game.top_card.code), key = GREEDY_WEIGHT.__getitem__, reverse = True):
+		top_code = card_code(wild_color, code_symbol(code)) if code_color(code) in WILD_LIST else code
+		playable = PLAYABLE[top_code]
+		follow_ups = sum(1 for other in hand if playable[other]) - 1
+		score = 2 * GREEDY_WEIGHT[code] + follow_ups
+		if best_score is None or score > best_score:
+			best, best_score = code, score
+		if time.perf_counter() > deadline:
+			break
+	if best is None:
+		return None
+	return code_color(best), code_symbol(best), wild_color
+
+
+def play_bot_turn(room):
+	#Plays one move if it is the turn of a bot. The move changes the room, which schedules the next bot turn if there is one
+	with room.lock:
+		if room.closed or not room.inGame or room.game.game_end:
+			return
+		player = room.game.current_player()
+		if not player.auto:
+			return
+		move = choose_move(room.game, player)
+		if move is not None:
+			room.play_card(player, *move)
+		elif not player.drew and not room.game.deck.is_deck_empty():
+			room.draw_card(player)
+		else:
+			room.skip_card(player)
+
+
+class BotRunner:
+	"""The background thread playing the bot turns of every room, one move at a time, in the order the rooms asked for it"""
+	def __init__(self):
+		self.queue = Queue()
+		self.pending = set() #Rooms in the queue, a room is only queued once
+		self.lock = Lock()
+		self.thread = None
+
+	def room_changed(self, room):
+		#Room listener, called with the room lock held
+		if not room.inGame or room.game is None or room.game.game_end or not room.game.current_player().auto:
+			return
+		with self.lock:
+			if room in self.pending:
+				return
+			self.pending.add(room)
+			if self.thread is None:
+				self.thread = Thread(target = self.run, daemon = True)
+				self.thread.start()
+		self.queue.put(room)
+
+	def run(self):
+		while True:
+			room = self.queue.get()
+			with self.lock:
+				self.pending.discard(room)
+			try:
+				play_bot_turn(room)
+			except Exception:
+				traceback.print_exc()
+
+
+BOT_RUNNER = BotRunner()
+ROOM_LISTENERS.append(BOT_RUNNER.room_changed)
+#Rooms restored from the store may be waiting for a bot
+for room in list(ROOM_DICT.values()):
+	with room.lock:
+		BOT_RUNNER.room_changed(room)
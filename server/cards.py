@@ -8,9 +8,13 @@ Red,Yellow,Blue,Green
 and
 Wild
 Wild(x4), Draw4(x4)
+Each card also has a one byte code: index of the color in COLOR_LIST + WILD_LIST * 16 + index of the symbol in SYMBOL_LIST + WILD_SYMBOL_LIST.
+A played wild card takes the chosen color, for example "Red" "W", and has its own code.
+Decks and hands store the codes, Card objects are views of a code.
+Played cards go to the discard pile of the deck, which is shuffled back into the draw pile when it runs out.
 Ray Gong, ruiduoray@berkeley.edu, 8/22/2020
 """
-from random import shuffle
+from random import Random
 
 
 COLOR_LIST = ["Red", "Yellow", "Blue", "Green"]
@@ -22,10 +26,45 @@ SORT_WEIGHT = {"Wild": 0, "Red": 1, "Yellow": 2, "Blue": 3, "Green": 4,
 "W": 1, "D4": 0}
 
 
+ALL_COLOR_LIST = COLOR_LIST + WILD_LIST
+ALL_SYMBOL_LIST = SYMBOL_LIST + WILD_SYMBOL_LIST
+CARD_CODES = {} #(color, symbol) -> code of every valid card
+for color in COLOR_LIST:
+	for symbol in ALL_SYMBOL_LIST:
+		CARD_CODES[(color, symbol)] = ALL_COLOR_LIST.index(color) * 16 + ALL_SYMBOL_LIST.index(symbol)
+for color in WILD_LIST:
+	for symbol in WILD_SYMBOL_LIST:
+		CARD_CODES[(color, symbol)] = ALL_COLOR_LIST.index(color) * 16 + ALL_SYMBOL_LIST.index(symbol)
+
+
+def card_code(color, symbol):
+	return CARD_CODES[(color, symbol)]
+
+def code_color(code):
+	return ALL_COLOR_LIST[code >> 4]
+
+def code_symbol(code):
+	return ALL_SYMBOL_LIST[code & 15]
+
+
 class Card:
+	__slots__ = ['code']
+
 	def __init__(self, color, symbol):
-		self.color = color
-		self.symbol = symbol
+		self.code = card_code(color, symbol)
+
+	@staticmethod
+	def from_code(code):
+		#Cards never change, so every code has one shared Card object
+		return CARD_OF_CODE[code]
+
+	@property
+	def color(self):
+		return code_color(self.code)
+
+	@property
+	def symbol(self):
+		return code_symbol(self.code)
 
 	def playable(self, prev_card):
 		if self.color == "Wild" or prev_card.color == 'Wild':
@@ -34,6 +73,12 @@ class Card:
 			return True
 		return False
 
+	def __eq__(self, other):
+		return isinstance(other, Card) and self.code == other.code
+
+	def __hash__(self):
+		return self.code
+
 	def __str__(self):
 		return self.color + " " + self.symbol
 
@@ -41,39 +86,88 @@ class Card:
 		return self.__str__()
 
 
+CARD_OF_CODE = {code: Card(color, symbol) for (color, symbol), code in CARD_CODES.items()}
+CODE_COUNT = len(ALL_COLOR_LIST) * 16 #Every code is below CODE_COUNT
+#PLAYABLE[top card code][card code] is 1 if the card can be played on the top card
+PLAYABLE = [bytearray(CODE_COUNT) for _ in range(CODE_COUNT)]
+for top_code, top_card in CARD_OF_CODE.items():
+	for code, card in CARD_OF_CODE.items():
+		PLAYABLE[top_code][code] = card.playable(top_card)
+
+
+DECK_CODES = bytearray() #The codes of the 108 cards of a full deck
+for color in COLOR_LIST:
+	for symbol in SYMBOL_LIST:
+		if symbol == "0":
+			amount = 1
+		else:
+			amount = 2
+		DECK_CODES.extend([card_code(color, symbol)] * amount)
+for color in WILD_LIST:
+	for symbol in WILD_SYMBOL_LIST:
+		DECK_CODES.extend([card_code(color, symbol)] * 4)
+
+
 class Deck:
-	def __init__(self):
-		self._deck = []
-		for color in COLOR_LIST:
-			for symbol in SYMBOL_LIST:
-				if symbol == "0":
-					amount = 1
-				else:
-					amount = 2
-				for _ in range(amount):
-					self._deck.append(Card(color, symbol))
-		for color in WILD_LIST:
-			for symbol in WILD_SYMBOL_LIST:
-				for _ in range(4):
-					self._deck.append(Card(color,symbol))
-		shuffle(self._deck)
+	"""The draw pile and the discard pile share one buffer with a slot for every card of the deck.
+	The draw pile fills the buffer from the start, with the next card to draw at its end, and the discard pile fills it from the end.
+	The cards in the hands and the top card are in neither pile, so the two piles never meet.
+	When the draw pile runs out, the discard pile is moved to the start of the buffer and shuffled in place."""
+	def __init__(self, rng = None):
+		#rng is the random.Random used to shuffle, pass a seeded one to get the same game again
+		self.rng = rng if rng is not None else Random()
+		self._deck = bytearray(DECK_CODES)
+		self.reset()
+
+	def reset(self):
+		#Gather every card back into the draw pile for a new game, reusing the same buffer
+		self._deck[:] = self.full_deck()
+		self.rng.shuffle(self._deck)
+		self.draw_size = len(self._deck)
+		self.discard_size = 0
+
+	def full_deck(self):
+		return DECK_CODES
+
+	def draw_code(self):
+		if self.draw_size == 0:
+			self.reshuffle()
+		if self.draw_size == 0:
+			raise Exception("No card left to draw")
+		self.draw_size -= 1
+		return self._deck[self.draw_size]
 
 	def draw_card(self):
-		return self._deck.pop()
+		return Card.from_code(self.draw_code())
+
+	def discard(self, card):
+		#A played wild card goes back to the pile without its chosen color
+		code = card.code
+		if code_symbol(code) in WILD_SYMBOL_LIST:
+			code = card_code("Wild", code_symbol(code))
+		self.discard_size += 1
+		self._deck[len(self._deck) - self.discard_size] = code
+
+	def reshuffle(self):
+		#Turn the discard pile into the draw pile. Called when the draw pile is empty
+		size = self.discard_size
+		self._deck[self.draw_size:self.draw_size + size] = self._deck[len(self._deck) - size:]
+		self.draw_size += size
+		self.discard_size = 0
+		with memoryview(self._deck)[:self.draw_size] as pile:
+			self.rng.shuffle(pile)
 
 	def is_deck_empty(self):
-		return len(self._deck) > 0
+		return self.draw_size + self.discard_size == 0
 
 	def cards_left(self):
-		return len(self._deck)
+		return self.draw_size
 
 
 #Only for testing purpose
 class WildDeck(Deck):
-	def __init__(self):
-		self._deck = []
-		for _ in range(108):
-			self._deck.append(Card("Wild", "W"))
+	def full_deck(self):
+		return bytearray([card_code("Wild", "W")] * 108)
 
 
 def sort_card_list(card_list):
@@ -82,4 +176,13 @@ def sort_card_list(card_list):
 def sort_str_card_list(str_list):
 	ret = list(str_list)
 	ret.sort(key = lambda card: SORT_WEIGHT[card[0]] * 15 + SORT_WEIGHT[card[1]])
-	return ret
\ No newline at end of file
+	return ret
+
+"""
+Compact wire format of a card list: the hex string of the card codes, for example [("Red", "7"), ("Wild", "W")] is "074d"
+"""
+def pack_cards(card_list):
+	return bytes(card_code(color, symbol) for color, symbol in card_list).hex()
+
+def unpack_cards(packed):
+	return [[code_color(code), code_symbol(code)] for code in bytes.fromhex(packed)]
\ No newline at end of file
@@ -7,8 +7,15 @@ from cards import *
 from player import *
 
 class Game:
-	def __init__(self, user_list):
-		self.deck = Deck()
+	def __init__(self, user_list, deck = None, rng = None):
+		#A deck of a previous game can be passed in to be reused. A seeded random.Random makes the game reproducible
+		if deck is None:
+			self.deck = Deck(rng)
+		else:
+			self.deck = deck
+			if rng is not None:
+				self.deck.rng = rng
+			self.deck.reset()
 		self.player_list = [Player(user_list[i], i) for i in range(len(user_list))]
 		for player in self.player_list:
 			for _ in range(7):
@@ -24,29 +31,32 @@ class Game:
 	def play(self, player, color, symbol, wild_color = None):
 		if player is not self.current_player():
 			raise Exception("Not current player")
-		if not player.in_hand(color, symbol):
+		code = CARD_CODES.get((color, symbol))
+		if code is None or code not in player.hands:
 			raise Exception("Card not in hand")
-		card = player.get_card(color, symbol)	
-		if not card.playable(self.top_card):
+		if not PLAYABLE[self.top_card.code][code]:
 			raise Exception("Card not playable")
 		if color in WILD_LIST and wild_color is None:
 			raise Exception("No color for wild card")
+		if color in WILD_LIST and wild_color not in COLOR_LIST:
+			raise Exception("Unknown color for wild card")
 
-		self.top_card = player.play_card(color, symbol)
-		card = self.top_card
-
+		player.hands.remove(code)
+		card = Card.from_code(code)
 		if color == "Wild":
-			card.color = wild_color
+			#The played wild card shows the chosen color
+			card = Card(wild_color, symbol)
+		self.deck.discard(self.top_card)
+		self.top_card = card
+
 		if card.symbol == "R":
 			self.direction *= -1
 		elif card.symbol == "S":
 			self.current_player_index = self.next_player_index()
 		elif card.symbol == "D":
-			for _ in range(2):
-				self.deal_card_to_player(self.next_player())
+			self.deal_penalty(self.next_player(), 2)
 		elif card.symbol == "D4":
-			for _ in range(4):
-				self.deal_card_to_player(self.next_player())
+			self.deal_penalty(self.next_player(), 4)
 		player.drew = False
 		if not player.still_in_game():
 			self.rank_list.append(player.user.username)
@@ -62,13 +72,15 @@ class Game:
 			raise Exception("Not current player")
 		if player.drew:
 			raise Exception("Player already drew a card this round")
+		if self.deck.is_deck_empty():
+			raise Exception("No card left to draw, skip instead")
 		self.deal_card_to_player(player)
 		player.drew = True
 
 	def skip(self, player):
 		if player is not self.current_player():
 			raise Exception("Not current player")
-		if not player.drew:
+		if not player.drew and not self.deck.is_deck_empty():
 			raise Exception("Player haven't drew a card yet")
 		self.current_player_index = self.next_player_index()
 		player.drew = False
@@ -76,6 +88,13 @@ class Game:
 	def deal_card_to_player(self, player):
 		player.add_card(self.deck.draw_card())
 
+	def deal_penalty(self, player, amount):
+		#When every card is in the hands, the player only gets the cards that are left
+		for _ in range(amount):
+			if self.deck.is_deck_empty():
+				break
+			self.deal_card_to_player(player)
+
 	def next_player_index(self):
 		ret = (self.current_player_index + self.direction) % self.player_amount
 		while not self.player_list[ret].still_in_game():
@@ -0,0 +1,59 @@
+"""
+lobby.py
+This file handles the lobby listing sent by lobby_info.
+The summaries of all the rooms are read from the store once per lobby version into a LobbySnapshot, which every lobby request
+of that version is served from. The rooms matching a filter are kept in the snapshot too, so a page is a slice of a cached list.
+"""
+from threading import Lock
+from room import *
+
+LOBBY_PAGE_SIZE = 4
+MAX_LOBBY_PAGE_SIZE = 100
+#Filters kept per snapshot. The host prefix is typed by the users, so the cache is emptied when it is full
+MAX_CACHED_FILTERS = 64
+
+
+class LobbySnapshot:
+	def __init__(self, version, summaries):
+		self.version = version
+		self.summaries = summaries
+		self.room_numbers = sorted(summaries)
+		self.filtered = {(False, False, ''): self.room_numbers} #(waiting, free_seats, host prefix): room numbers in order
+		self.lock = Lock()
+
+	def select(self, waiting = False, free_seats = False, host = ''):
+		#The numbers of the rooms matching the filters, in room number order
+		key = (waiting, free_seats, host)
+		with self.lock:
+			if key in self.filtered:
+				return self.filtered[key]
+		room_numbers = [room_number for room_number in self.room_numbers if matches(self.summaries[room_number], waiting, free_seats, host)]
+		with self.lock:
+			if len(self.filtered) >= MAX_CACHED_FILTERS:
+				self.filtered = {(False, False, ''): self.room_numbers}
+			self.filtered[key] = room_numbers
+		return room_numbers
+
+	def rooms(self, room_numbers):
+		return {room_number: self.summaries[room_number] for room_number in room_numbers}
+
+
+def matches(summary, waiting, free_seats, host):
+	if waiting and summary['inGame']:
+		return False
+	if free_seats and summary['user_number'] >= Room.MAX_PLAYER:
+		return False
+	return summary['hostname'].startswith(host)
+
+
+LOBBY_SNAPSHOT = None
+SNAPSHOT_LOCK = Lock()
+
+def lobby_snapshot(version):
+	"""The snapshot of the given lobby version, built on the first request after a change.
+	The version is read before the summaries, so a snapshot is never older than its version"""
+	global LOBBY_SNAPSHOT
+	with SNAPSHOT_LOCK:
+		if LOBBY_SNAPSHOT is None or LOBBY_SNAPSHOT.version != version:
+			LOBBY_SNAPSHOT = LobbySnapshot(version, STORE.room_summaries())
+		return LOBBY_SNAPSHOT
@@ -0,0 +1,89 @@
+"""
+matchmaking.py
+This file handles the quick match queue: a user asks for a game of a given number of players and is seated as soon as enough users
+asked for the same number. The queue has one bucket per number of players, each keeping its users in arrival order,
+so queuing, leaving the queue and taking the first users of a bucket do not depend on how many users are waiting elsewhere.
+A full bucket makes a room hosted by its first user, seats the others, and starts the game.
+The queue is kept per server: with several shards the users are matched with the users queued on the same shard.
+"""
+from threading import Lock
+from room import *
+
+MIN_MATCH_PLAYERS = 2
+DEFAULT_MATCH_PLAYERS = 4
+#Guards MATCH_BUCKETS and User.match_players. Rooms are created without holding it
+MATCH_LOCK = Lock()
+#Number of players: {session token: user} of the users waiting for that number, in arrival order.
+#The token stays the same when a user changes its username
+MATCH_BUCKETS = {players: {} for players in range(MIN_MATCH_PLAYERS, Room.MAX_PLAYER + 1)}
+
+
+def queued(user):
+	#Users leaving the server or joining a room by themselves are not removed from their bucket, they are skipped when it fills up
+	return USER_DICT.get(user.username) is user and user.room is None
+
+def enqueue(user, players):
+	"""Put the user in the bucket of the number of players, or move the user there if already queued.
+	Returns the users of a full bucket, taken out of the queue, or None"""
+	with MATCH_LOCK:
+		if user.match_players is not None:
+			MATCH_BUCKETS[user.match_players].pop(user.token, None)
+		bucket = MATCH_BUCKETS[players]
+		bucket[user.token] = user
+		user.match_players = players
+		if len(bucket) < players:
+			return None
+		prune(bucket)
+		if len(bucket) < players:
+			return None
+		matched = [bucket.pop(token) for token in list(bucket)[:players]]
+		for other in matched:
+			other.match_players = None
+		return matched
+
+def prune(bucket):
+	#Removes the users not waiting anymore, each of them is only removed once. Called with MATCH_LOCK held
+	for token, other in list(bucket.items()):
+		if not queued(other):
+			del bucket[token]
+			other.match_players = None
+
+def dequeue(user):
+	#Returns False if the user was not waiting
+	with MATCH_LOCK:
+		if user.match_players is None:
+			return False
+		MATCH_BUCKETS[user.match_players].pop(user.token, None)
+		user.match_players = None
+		return True
+
+def requeue(users, players):
+	#Put back the users of a match that could not be seated, ahead of the users who came after them
+	with MATCH_LOCK:
+		bucket = MATCH_BUCKETS[players]
+		waiting = dict(bucket)
+		bucket.clear()
+		for user in users:
+			bucket[user.token] = user
+			user.match_players = players
+		bucket.update(waiting)
+
+def seat(users):
+	"""Make a room hosted by the first user, seat the others ready and start the game. Raises if the room can not be made.
+	Returns None if one of the users left in the meantime, the others are queued again"""
+	if not all(queued(user) for user in users):
+		requeue([user for user in users if queued(user)], len(users))
+		return None
+	room = Room(users[0].username)
+	with room.lock:
+		for user in users[1:]:
+			user.join_room(room)
+			user.ready = True
+		room.refresh_user_info()
+		room.start_game()
+	return room
+
+def waiting_count(players):
+	with MATCH_LOCK:
+		prune(MATCH_BUCKETS[players])
+		return len(MATCH_BUCKETS[players])
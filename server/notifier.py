@@ -0,0 +1,40 @@
+"""
+notifier.py
+This file handles the change notification used by the long-poll endpoint.
+Each channel (the lobby and every room) owns a Notifier. Every change bumps its version and wakes up
+the requests that are waiting on it, so clients only redraw when something actually changed.
+"""
+from threading import Condition, Lock
+
+
+class Notifier:
+	def __init__(self, lock = None):
+		#A room passes its own lock, so bumping the version and changing the room state happen under the same lock
+		self.version = 0
+		self.condition = Condition(lock)
+		self.listeners = []
+		#Guards the listeners only, so the event loop of asgi_server.py can add and remove listeners without waiting for a room lock
+		self.listeners_lock = Lock()
+
+	def notify(self):
+		with self.condition:
+			self.version += 1
+			self.condition.notify_all()
+			with self.listeners_lock:
+				for listener in self.listeners:
+					listener(self.version)
+
+	def add_listener(self, listener):
+		#listener(version) is called on every change. It is called under both locks, so it has to return quickly without taking a lock
+		with self.listeners_lock:
+			self.listeners.append(listener)
+
+	def remove_listener(self, listener):
+		with self.listeners_lock:
+			self.listeners.remove(listener)
+
+	def wait(self, version, timeout):
+		#Block until the version differs from the given one or until timeout. Returns the current version.
+		with self.condition:
+			self.condition.wait_for(lambda: self.version != version, timeout)
+			return self.version
@@ -0,0 +1,50 @@
+"""
+patch.py
+This file builds the game state patches sent by the game_patch endpoint.
+A patch only holds what changed between two game states of the same player:
+'set': dict of the changed plain fields (game_end, current_player, next_player, top_card, result)
+'player_colors': dict of player index -> new color, for the changed players only
+'player_card_nums': dict of player index -> new card amount, for the changed players only
+'cards_added': list of the cards the player gained
+'cards_removed': list of the cards the player lost
+
+Compact format, sent when the request form has 'compact' set:
+the card lists ('cards' of a state, 'cards_added' and 'cards_removed' of a patch) are packed strings (see pack_cards in cards.py)
+and 'top_card' is the card code instead of the (color, symbol) tuple
+"""
+from collections import Counter
+from cards import *
+
+LIST_FIELDS = ['player_colors', 'player_card_nums']
+
+
+def make_patch(old_state, new_state):
+	patch = {'set': {}}
+	for key, value in new_state.items():
+		if key in LIST_FIELDS or key == 'cards':
+			continue
+		if old_state.get(key) != value:
+			patch['set'][key] = value
+	for key in LIST_FIELDS:
+		old_list, new_list = old_state.get(key, []), new_state[key]
+		patch[key] = {i: new_list[i] for i in range(len(new_list)) if i >= len(old_list) or old_list[i] != new_list[i]}
+	old_cards, new_cards = Counter(old_state.get('cards', [])), Counter(new_state['cards'])
+	patch['cards_added'] = list((new_cards - old_cards).elements())
+	patch['cards_removed'] = list((old_cards - new_cards).elements())
+	return patch
+
+
+def compact_state(state):
+	state = dict(state)
+	state['cards'] = pack_cards(state['cards'])
+	state['top_card'] = card_code(*state['top_card'])
+	return state
+
+def compact_patch(patch):
+	patch = dict(patch)
+	if 'top_card' in patch['set']:
+		patch['set'] = dict(patch['set'])
+		patch['set']['top_card'] = card_code(*patch['set']['top_card'])
+	patch['cards_added'] = pack_cards(patch['cards_added'])
+	patch['cards_removed'] = pack_cards(patch['cards_removed'])
+	return patch
@@ -3,38 +3,76 @@ player.py
 This file handles the logic of players in the game
 Ray Gong, ruiduoray@berkeley.edu, 8/22/2020
 """
+from cards import *
+
 COLOR_DICT = {1: "Red", 2: "Yellow", 3: "Blue", 4: "Green"}
+HAND_CODES = sorted(set(DECK_CODES)) #The codes a card in a hand can have. Played wild cards only take a color on the top card
+
+class Hand:
+	"""The cards of a player as a multiset of card codes: counts[code] is how many of that card the player has,
+	so adding, finding and removing a card does not depend on the hand size"""
+	def __init__(self):
+		self.counts = [0] * CODE_COUNT
+		self.size = 0
+
+	def __len__(self):
+		return self.size
+
+	def __contains__(self, code):
+		return 0 <= code < CODE_COUNT and self.counts[code] > 0
+
+	def __iter__(self):
+		for code in HAND_CODES:
+			for _ in range(self.counts[code]):
+				yield code
+
+	def add(self, code):
+		self.counts[code] += 1
+		self.size += 1
+
+	def remove(self, code):
+		if code not in self:
+			raise ValueError("Card not in hand")
+		self.counts[code] -= 1
+		self.size -= 1
+
+	def playable_codes(self, top_code):
+		#The distinct cards of the hand that can be played on the top card
+		playable = PLAYABLE[top_code]
+		counts = self.counts
+		return [code for code in HAND_CODES if counts[code] and playable[code]]
+
 
 class Player:
 	def __init__(self, user, index):
 		user.player = self
-		self.hands = []
+		self.hands = Hand()
 		self.index = index
 		self.user = user
 		self.drew = False
+		self.auto = False #True if a bot plays the turns of this player
 
 	def still_in_game(self):
 		return len(self.hands) > 0
 
 	def add_card(self, card):
-		self.hands.append(card)
+		self.hands.add(card.code)
 
-	def pop_card(self, index):
-		return self.hands.pop(index)
+	def cards(self):
+		return [Card.from_code(code) for code in self.hands]
 
 	def in_hand(self, color, symbol):
-		for card in self.hands:
-			if color == card.color and symbol == card.symbol:
-				return True
-		return False
+		code = CARD_CODES.get((color, symbol))
+		return code is not None and code in self.hands
 
 	def get_card(self, color, symbol):
-		for card in self.hands:
-			if color == card.color and symbol == card.symbol:
-				return card
+		if self.in_hand(color, symbol):
+			return Card(color, symbol)
 
 	def play_card(self, color, symbol):
-		for card in self.hands:
-			if color == card.color and symbol == card.symbol:
-				self.hands.remove(card)
-				return card
\ No newline at end of file
+		if self.in_hand(color, symbol):
+			self.hands.remove(card_code(color, symbol))
+			return Card(color, symbol)
+
+	def playable_cards(self, top_card):
+		return [Card.from_code(code) for code in self.hands.playable_codes(top_card.code)]
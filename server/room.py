@@ -0,0 +1,438 @@
+"""
+room.py
+This file handles the rooms and the users of the server, and the registries holding them.
+It is shared by the Flask server (server.py) and the asyncio server (asgi_server.py).
+"""
+import heapq
+import os
+import secrets
+import time
+from itertools import count
+from threading import RLock
+from game import *
+from notifier import *
+from store import *
+from scheduler import *
+
+#Different for every run of the server, so the ETags handed out by a previous run never match the ones of this run
+ETAG_EPOCH = secrets.token_hex(4)
+#Numbers the Room objects of this run. Room numbers are reused and the version of a new Notifier starts at 0 again,
+#so the ETag of a room also holds the number of the Room object
+ROOM_INSTANCES = count()
+USERNAME_SET = set()
+USER_DICT = {}
+#Session token: user. A token is handed out by create_username and sent with every request of the user
+TOKEN_DICT = {}
+#Guards USERNAME_SET, USER_DICT, TOKEN_DICT and ROOM_REGISTRY.
+#Game and room state is guarded by the lock of each room. A room lock may be held while taking REGISTRY_LOCK, never the opposite
+REGISTRY_LOCK = RLock()
+LOBBY_NOTIFIER = Notifier()
+#The SQLite file shared by the server processes. Everything stays in memory if it is not set
+STORE = SQLiteStore(os.environ['UNO_STORE']) if os.environ.get('UNO_STORE') else MemoryStore()
+SHARD_INDEX = int(os.environ.get('UNO_SHARD_INDEX', 0))
+SHARD_COUNT = int(os.environ.get('UNO_SHARD_COUNT', 1))
+#The api url of every shard, in shard index order. Clients are sent there for the rooms of that shard
+SHARD_URLS = os.environ.get('UNO_SHARD_URLS', '').split(',')
+#Functions called with the room after every change of a room, while holding the room lock. bot.py adds one to play the bot turns
+ROOM_LISTENERS = []
+#Seconds between the updates of the last_seen of a user in a store shared by several shards
+STORE_SEEN_INTERVAL = 60
+#Rooms a server can hold at once
+ROOM_CAPACITY = int(os.environ.get('UNO_ROOM_CAPACITY', 20000))
+#Seconds a player has to play, draw or skip. When the time is up the server draws a card for the player and skips the turn
+TURN_TIMEOUT = float(os.environ.get('UNO_TURN_TIMEOUT', 30))
+
+class SessionError(Exception):
+	pass
+
+def get_session(token):
+	"""Return the user of the session token. The user holds its room and its player, so this one lookup is all a request needs.
+	A token issued by another shard gets a local User object on first use.
+	Every request goes through here, so it also records when the user was last seen."""
+	user = TOKEN_DICT.get(token)
+	if user is None and SHARD_COUNT > 1:
+		with REGISTRY_LOCK:
+			user = TOKEN_DICT.get(token)
+			username = STORE.token_username(token) if user is None else None
+			if username is not None:
+				user = USER_DICT[username] if username in USER_DICT else User(username, token)
+				TOKEN_DICT[token] = user
+	if user is None:
+		raise SessionError("Invalid session token")
+	user.seen()
+	return user
+
+def room_shard(room_number):
+	return room_number % SHARD_COUNT
+
+def wait_lobby_version(version, timeout):
+	#Other shards can not wake up the local notifier, so with several shards the shared lobby version is checked every second
+	if SHARD_COUNT == 1:
+		return LOBBY_NOTIFIER.wait(version, timeout)
+	deadline = time.monotonic() + timeout
+	while STORE.get_lobby_version() == version and time.monotonic() < deadline:
+		LOBBY_NOTIFIER.wait(LOBBY_NOTIFIER.version, 1)
+	return STORE.get_lobby_version()
+
+class RoomRegistry:
+	"""The rooms of this shard, by room number, and the numbers free for new rooms.
+	The room with slot i has the number SHARD_INDEX + i * SHARD_COUNT. Freed slots are kept in a heap, so a new room takes
+	the lowest free number in O(log n), and slots never used are handed out in order up to the capacity.
+	in_game indexes the rooms running a game, for the stats. Every method is called with REGISTRY_LOCK held"""
+	def __init__(self, capacity):
+		self.capacity = capacity
+		self.rooms = {}
+		self.free = [] #Heap of the freed slots below next_slot
+		self.next_slot = 0
+		self.in_game = {} #Rooms by room number
+
+	def __len__(self):
+		return len(self.rooms)
+
+	def add(self, room):
+		#Gives the room a number and registers it. Raises if the server is full
+		if self.free:
+			slot = heapq.heappop(self.free)
+		elif self.next_slot < self.capacity:
+			slot = self.next_slot
+			self.next_slot += 1
+		else:
+			raise Exception("Full Capacity")
+		room.room_number = SHARD_INDEX + slot * SHARD_COUNT
+		self.rooms[room.room_number] = room
+		self.set_in_game(room)
+
+	def remove(self, room):
+		del self.rooms[room.room_number]
+		self.in_game.pop(room.room_number, None)
+		heapq.heappush(self.free, room.room_number // SHARD_COUNT)
+
+	def set_in_game(self, room):
+		#Keeps the room in in_game while room.inGame is True
+		if room.inGame:
+			self.in_game[room.room_number] = room
+		else:
+			self.in_game.pop(room.room_number, None)
+
+	def restore(self, rooms):
+		#Registers the rooms loaded from the store with their saved numbers, the slots between them become free
+		for room in rooms:
+			self.rooms[room.room_number] = room
+			self.set_in_game(room)
+			self.next_slot = max(self.next_slot, room.room_number // SHARD_COUNT + 1)
+		self.free = [slot for slot in range(self.next_slot) if SHARD_INDEX + slot * SHARD_COUNT not in self.rooms]
+		heapq.heapify(self.free)
+
+
+ROOM_REGISTRY = RoomRegistry(ROOM_CAPACITY)
+ROOM_DICT = ROOM_REGISTRY.rooms
+
+class Room:
+	MAX_PLAYER = 10
+	def __init__(self, hostname):
+		#Every change of the room and of its game happens while holding self.lock
+		self.lock = RLock()
+		self.instance = ETAG_EPOCH + '.' + str(next(ROOM_INSTANCES))
+		self.hostname = hostname
+		self.hostuser = USER_DICT[hostname]
+		self.userlist = [self.hostuser]
+		self.inGame = False
+		self.closed = False
+		self.game = None
+		self.game_info = None
+		self.game_ended_at = None #time.time() of the end of the last game, see sweeper.py
+		self.deck = None #Kept from game to game
+		self.notifier = Notifier(self.lock)
+		self.turn_deadline = None
+		self.turn_timer_armed = False
+		with REGISTRY_LOCK:
+			ROOM_REGISTRY.add(self)
+			self.room_info = {'room_number': self.room_number, 'user_number': len(self.userlist), 'hostname': self.hostname,
+					'inGame': self.inGame, 'user_info': {}, 'bots': []}
+			self.refresh_user_info()
+		#The host only enters the room once it got a number
+		self.hostuser.room = self
+		self.notify(lobby = True)
+
+	#The info dicts are never changed in place, changed values are replaced by new objects,
+	#so a shallow copy taken under the lock is a consistent snapshot
+	def refresh_user_info(self):
+		self.room_info['user_info'] = {str(i): (self.userlist[i].username, self.userlist[i].ready) for i in range(len(self.userlist))}
+		self.room_info['bots'] = [user.username for user in self.userlist if user.bot]
+
+	def get_room_info(self):
+		with self.lock:
+			return dict(self.room_info)
+
+	def get_game_info(self, user):
+		#The game info with the cards of the given user. It is built for each request, the shared game_info is not changed
+		with self.lock:
+			game_info = dict(self.game_info)
+			game_info['cards'] = [(card.color, card.symbol) for card in user.player.cards()]
+			return game_info
+
+	def join_user(self, user):
+		with self.lock:
+			if self.closed:
+				raise Exception("Room closed")
+			if self.inGame:
+				raise Exception("Game already started")
+			if len(self.userlist) >= self.MAX_PLAYER:
+				raise Exception("Full Room")
+			self.userlist.append(user)
+			user.room = self
+			self.refresh_user_info()
+			self.room_info['user_number'] += 1
+			self.notify(lobby = True)
+
+	def quit_user(self, user):
+		with self.lock:
+			self.userlist.remove(user)
+			self.refresh_user_info()
+			self.room_info['user_number'] -= 1
+			if self.inGame and user.player in self.game.player_list:
+				#A bot plays the turns of a player leaving during the game
+				user.player.auto = True
+			if self.hostuser is user:
+				humans = [other for other in self.userlist if not other.bot]
+				if len(humans) > 0:
+					self.hostuser = humans[0]
+					self.hostname = self.hostuser.username
+					self.room_info['hostname'] = self.hostname
+				else:
+					for bot in list(self.userlist):
+						bot.release()
+					self.clean_up()
+			self.notify(lobby = True)
+
+	def toggle_ready(self, user):
+		with self.lock:
+			user.ready = not user.ready
+			self.refresh_user_info()
+			self.notify()
+
+	def clean_up(self):
+		with self.lock:
+			self.closed = True
+			with REGISTRY_LOCK:
+				ROOM_REGISTRY.remove(self)
+			STORE.delete_room(self.room_number)
+		LOBBY_NOTIFIER.notify()
+
+	def etag(self):
+		#The state version of the room. It is bumped by every change of the room or of its game
+		return str(self.room_number) + '-' + self.instance + '-' + str(self.notifier.version)
+
+	def notify(self, lobby = False, turn = False):
+		"""Save the changed room, then wake up the clients waiting on this room, and the lobby clients if the lobby listing changed.
+		turn is True for the changes made by a move of the game, which restart the turn time"""
+		if self.closed:
+			return
+		STORE.save_room(self, lobby)
+		self.notifier.notify()
+		if lobby:
+			LOBBY_NOTIFIER.notify()
+		for listener in ROOM_LISTENERS:
+			listener(self)
+		if turn:
+			self.arm_turn_timer()
+
+	def arm_turn_timer(self):
+		"""Every move restarts the turn time, so the timer only fires when the current player does nothing.
+		Other changes of the room, such as a player toggling ready or leaving, do not restart it.
+		A room has at most one scheduled check: a check finding a later deadline is scheduled again for that deadline"""
+		if not self.inGame or self.game.game_end:
+			return
+		self.turn_deadline = time.monotonic() + TURN_TIMEOUT
+		if not self.turn_timer_armed:
+			self.turn_timer_armed = True
+			SCHEDULER.call_at(self.turn_deadline, self.check_turn_timer)
+
+	def check_turn_timer(self):
+		with self.lock:
+			self.turn_timer_armed = False
+			if self.closed or not self.inGame or self.game.game_end:
+				return
+			if time.monotonic() < self.turn_deadline:
+				self.turn_timer_armed = True
+				SCHEDULER.call_at(self.turn_deadline, self.check_turn_timer)
+				return
+			player = self.game.current_player()
+			if not player.drew and not self.game.deck.is_deck_empty():
+				self.game.draw(player)
+			self.game.skip(player)
+			self.update_color_and_card_num()
+			self.notify(turn = True)
+
+	def __getstate__(self):
+		#Locks can not be pickled, they are created again when the room is loaded from the store
+		state = dict(self.__dict__)
+		del state['lock'], state['notifier']
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.lock = RLock()
+		self.notifier = Notifier(self.lock)
+		#The version of the new notifier starts at 0 again
+		self.instance = ETAG_EPOCH + '.' + str(next(ROOM_INSTANCES))
+		#The deadline was a time.monotonic() value of the process that saved the room
+		self.turn_deadline = None
+		self.turn_timer_armed = False
+
+	def start_game(self):
+		with self.lock:
+			#The deck of the previous game is reused
+			self.game = Game(self.userlist, self.deck)
+			self.deck = self.game.deck
+			for player in self.game.player_list:
+				player.auto = player.user.bot
+			#The patches of the new game must not be built against the last state sent of the previous one
+			for user in self.userlist:
+				user.sent_game_state = None
+			self.game_info = {'game_end': self.game.game_end, 'current_player': self.game.current_player().user.username, 
+			'next_player': self.game.next_player().user.username,'top_card': (self.game.top_card.color, self.game.top_card.symbol),
+			'cards': [], 'player_colors': [], 'player_card_nums': []}
+			self.update_color_and_card_num()
+			self.inGame = True
+			self.room_info['inGame'] = True
+			with REGISTRY_LOCK:
+				ROOM_REGISTRY.set_in_game(self)
+			self.notify(lobby = True, turn = True)
+
+	def update_color_and_card_num(self):
+		player_colors, player_card_nums = [], []
+		for player in self.game.player_list:
+			if len(player.hands) <= 0:
+				player_colors.append('grey')
+			elif self.game.current_player() is player:
+				player_colors.append('green')
+			elif self.game.next_player() is player:
+				player_colors.append('yellow')
+			else:
+				player_colors.append('white')
+			player_card_nums.append(len(player.hands))
+		self.game_info['player_colors'] = player_colors
+		self.game_info['player_card_nums'] = player_card_nums
+
+	#The turns are played by seat, not by user: the player of a user who left is played by a bot while the user may be in another game
+	def play_card(self, player, color, symbol, wild_color = None):
+		with self.lock:
+			self.game.play(player, color, symbol, wild_color)
+			self.game_info['top_card'] = (self.game.top_card.color, self.game.top_card.symbol)
+			self.update_color_and_card_num()
+			if self.game.game_end:
+				self.game_ended_at = time.time()
+				self.game_info['game_end'] = True
+				self.game_info['result'] = "\n".join([str(i + 1) + '. ' + self.game.rank_list[i] for i in range(len(self.game.rank_list))])
+				for user in self.userlist:
+					user.ready = user.bot
+				self.refresh_user_info()
+				self.inGame = False
+				self.room_info['inGame'] = False
+				with REGISTRY_LOCK:
+					ROOM_REGISTRY.set_in_game(self)
+			self.notify(lobby = self.game.game_end, turn = True)
+
+	def draw_card(self, player):
+		with self.lock:
+			self.game.draw(player)
+			self.update_color_and_card_num()
+			self.notify(turn = True)
+
+	def skip_card(self, player):
+		with self.lock:
+			self.game.skip(player)
+			self.update_color_and_card_num()
+			self.notify(turn = True)
+
+
+class User:
+	bot = False #True for the bots of bot.py
+	match_players = None #Number of players of the quick match the user waits for, see matchmaking.py
+
+	def __init__(self, username, token = None):
+		self.username = username
+		#Token of the session of the user, a new one unless the user was created on another shard
+		self.token = token if token is not None else secrets.token_urlsafe(24)
+		self.room = None
+		self.ready = False
+		self.player = None
+		self.index = None
+		self.sent_game_state = None #(etag, game state) last sent by game_patch, patches are built against it
+		self.last_seen = time.time()
+		self.store_seen = 0 #Last time last_seen was written to the store
+		self.sessions = 0 #Open WebSocket sessions of the user, see asgi_server.py
+		with REGISTRY_LOCK:
+			USER_DICT[username] = self
+			USERNAME_SET.add(username)
+			TOKEN_DICT[self.token] = self
+
+	def change_username(self, new_username):
+		#The new username is already reserved in the store. The session token stays the same
+		old_username = self.username
+		with REGISTRY_LOCK:
+			USER_DICT.pop(old_username)
+			USERNAME_SET.remove(old_username)
+			USER_DICT[new_username] = self
+			USERNAME_SET.add(new_username)
+			self.username = new_username
+		STORE.release_username(old_username)
+		room = self.room
+		if room is not None:
+			with room.lock:
+				if room.hostuser is self:
+					room.hostname = new_username
+					room.room_info['hostname'] = new_username
+				room.refresh_user_info()
+				room.notify(lobby = True)
+
+	def seen(self):
+		self.last_seen = time.time()
+		if SHARD_COUNT > 1 and self.last_seen - self.store_seen > STORE_SEEN_INTERVAL:
+			self.store_seen = self.last_seen
+			STORE.touch_username(self.username, self.last_seen)
+
+	def join_room(self, room):
+		self.ready = False
+		room.join_user(self)
+
+	def quit_room(self):
+		self.room.quit_user(self)
+		self.room = None
+
+
+	def clean_up(self, release_username = True):
+		#release_username is False when the username may still be in use on another shard
+		with REGISTRY_LOCK:
+			USER_DICT.pop(self.username)
+			USERNAME_SET.remove(self.username)
+			TOKEN_DICT.pop(self.token, None)
+		if release_username:
+			STORE.release_username(self.username)
+		if self.room is not None:
+			self.room.quit_user(self)
+
+	def __str__(self):
+		return self.username
+
+	def __repr__(self):
+		return self.__str__()
+
+
+def restore_rooms():
+	#Load the rooms of this shard saved by a previous run of the server
+	rooms = STORE.load_rooms(SHARD_INDEX, SHARD_COUNT)
+	with REGISTRY_LOCK:
+		ROOM_REGISTRY.restore(rooms)
+	for room in rooms:
+		with REGISTRY_LOCK:
+			for user in room.userlist:
+				USER_DICT[user.username] = user
+				USERNAME_SET.add(user.username)
+				TOKEN_DICT[user.token] = user
+				user.last_seen, user.store_seen, user.sessions = time.time(), 0, 0
+		with room.lock:
+			room.arm_turn_timer()
+
+restore_rooms()
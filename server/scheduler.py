@@ -0,0 +1,49 @@
+"""
+scheduler.py
+This file handles the delayed work of the server: callbacks run at a given time by one background thread for the whole process,
+taken from a heap ordered by due time. Nothing runs and nothing is polled while the heap is empty or its first callback is not due.
+Callbacks run one at a time and should be short, and there is no cancel: a callback checks itself whether it is still needed.
+"""
+import heapq
+import time
+import traceback
+from itertools import count
+from threading import Condition, Thread
+
+
+class Scheduler:
+	def __init__(self):
+		self.heap = [] #(due time, insertion number, callback, args)
+		self.condition = Condition()
+		self.counter = count()
+		self.thread = None
+
+	def call_at(self, when, callback, *args):
+		#when is a time.monotonic() value
+		with self.condition:
+			heapq.heappush(self.heap, (when, next(self.counter), callback, args))
+			if self.thread is None:
+				self.thread = Thread(target = self.run, daemon = True)
+				self.thread.start()
+			if self.heap[0][0] == when:
+				self.condition.notify()
+
+	def call_later(self, delay, callback, *args):
+		self.call_at(time.monotonic() + delay, callback, *args)
+
+	def __len__(self):
+		return len(self.heap)
+
+	def run(self):
+		while True:
+			with self.condition:
+				while not self.heap or self.heap[0][0] > time.monotonic():
+					self.condition.wait(self.heap[0][0] - time.monotonic() if self.heap else None)
+				when, _, callback, args = heapq.heappop(self.heap)
+			try:
+				callback(*args)
+			except Exception:
+				traceback.print_exc()
+
+
+SCHEDULER = Scheduler()
@@ -0,0 +1,65 @@
+"""
+sim_runner.py
+Runs the simulations of simulation.py and batch_simulation.py on every core.
+The games are split into tasks of --tasks-size games, each task is played by a worker process and the results are merged in task order,
+so a run with a seed gives the same result whatever the number of workers.
+To run 1000000 games between two greedy players, run 'python3 sim_runner.py --games 1000000 --policies greedy,greedy --seed 1'
+To play a game of a seeded run again, run 'python3 sim_runner.py --policies greedy,greedy --replay <game seed>'
+where the game seed is the one printed for the longest game, or game_seed(seed, game number) of simulation.py
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from random import SystemRandom
+from simulation import *
+
+
+def run_task(engine, policy_names, seed, start, games, max_turns):
+	if engine == 'batch':
+		#The batched games share one generator, seeded with the seed of the run and the first game number of the task
+		import numpy as np
+		from batch_simulation import simulate_batch
+		return simulate_batch(policy_names, games, max_turns, np.random.default_rng([seed, start]))
+	return simulate(policy_names, games, max_turns, seed, start)
+
+
+def run(policy_names, games, seed, engine = 'single', task_size = 2000, workers = None, max_turns = MAX_TURNS):
+	result = SimulationResult(policy_names)
+	starts = range(0, games, task_size)
+	with ProcessPoolExecutor(max_workers = workers) as executor:
+		futures = [executor.submit(run_task, engine, policy_names, seed, start, min(task_size, games - start), max_turns) for start in starts]
+		for future in futures:
+			result.merge(future.result())
+	return result
+
+
+def print_replay(policy_names, seed):
+	game = replay(policy_names, seed)
+	print("first top card: " + str(CARD_OF_CODE[game.first_top_code]))
+	for turn, (index, code) in enumerate(game.history):
+		print(str(turn) + ". player " + str(index) + ": " + (str(CARD_OF_CODE[code]) if code is not None else "draw or skip"))
+	print("ranking: " + ", ".join(str(index) for index in game.rank_list))
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = "Play headless games on all the cores")
+	parser.add_argument('--games', type = int, default = 100000)
+	parser.add_argument('--policies', default = 'greedy,random', help = "Comma separated policy of each seat: " + ", ".join(POLICIES))
+	parser.add_argument('--seed', type = int, default = None, help = "Seed of the run, a random one is picked and printed if not given")
+	parser.add_argument('--engine', default = 'single', choices = ['single', 'batch'],
+		help = "single plays the games one by one (each game can be replayed), batch plays them in lock-step with NumPy")
+	parser.add_argument('--task-size', type = int, default = 2000, help = "Games sent to a worker at once")
+	parser.add_argument('--workers', type = int, default = os.cpu_count())
+	parser.add_argument('--replay', type = int, default = None, help = "Game seed of a game to play again and print")
+	args = parser.parse_args()
+	policy_names = args.policies.split(',')
+	if args.replay is not None:
+		print_replay(policy_names, args.replay)
+	else:
+		seed = args.seed if args.seed is not None else SystemRandom().randrange(2 ** 31)
+		start = time.time()
+		result = run(policy_names, args.games, seed, args.engine, args.task_size, args.workers)
+		print("seed " + str(seed))
+		print(result.report())
+		print("{:.0f} games per second".format(result.games / (time.time() - start)))
@@ -0,0 +1,226 @@
+"""
+simulation.py
+Headless games between policies, without the server, users or rooms.
+The rules are the same as game.py: the cards, the deck and the hands come from cards.py and player.py.
+To run games from the command line, run 'python3 simulation.py --games 10000 --policies greedy,random,random'
+
+A policy is a function policy(game, player_index, playable_codes) called when it is the turn of the player.
+playable_codes lists the distinct codes of the cards of the player that can be played on game.top_code.
+It returns None to draw a card (or to skip after having drawn), or the code of the card to play and the chosen color
+for a wild card: (code, wild_color), where wild_color is only read for a wild card.
+A policy making random choices uses game.rng, so that a game is the same every time it is played from the same seed.
+Game number i of a run with seed s is played from the seed game_seed(s, i), see replay to play it again.
+"""
+from random import Random
+from collections import Counter
+from cards import *
+from player import Hand
+
+MAX_TURNS = 5000 #A game still going after that many turns is stopped and counted as unfinished
+
+
+class SimulatedGame:
+	def __init__(self, policies, deck = None, rng = None, record = False):
+		#policies holds the policy of each player. A deck of a previous game can be passed in to be reused.
+		#With record set, history lists the moves: (player index, code of the played card, or None for a draw or a skip)
+		self.rng = rng if rng is not None else Random()
+		if deck is None:
+			self.deck = Deck(self.rng)
+		else:
+			self.deck = deck
+			self.deck.rng = self.rng
+			self.deck.reset()
+		self.policies = policies
+		self.history = [] if record else None
+		self.player_amount = len(policies)
+		self.hands = [Hand() for _ in range(self.player_amount)]
+		for hand in self.hands:
+			for _ in range(7):
+				hand.add(self.deck.draw_code())
+		self.top_code = self.first_top_code = self.deck.draw_code()
+		self.direction = 1
+		self.current_player_index = 0
+		self.players_left = self.player_amount
+		self.rank_list = []
+		self.turns = 0
+
+	def run(self, max_turns = MAX_TURNS):
+		#Plays the game to its end. Returns the ranking (player indexes), with the unfinished players missing if the game was stopped
+		while self.players_left > 1 and self.turns < max_turns:
+			self.turn()
+		if self.players_left <= 1:
+			self.rank_list.extend(i for i in range(self.player_amount) if len(self.hands[i]) > 0)
+		return self.rank_list
+
+	def turn(self):
+		index = self.current_player_index
+		hand = self.hands[index]
+		policy = self.policies[index]
+		self.turns += 1
+		choice = policy(self, index, hand.playable_codes(self.top_code))
+		if choice is None:
+			#Draw, then play or skip
+			if self.deck.is_deck_empty():
+				self.skip(index)
+				return
+			hand.add(self.deck.draw_code())
+			if self.history is not None:
+				self.history.append((index, None))
+			choice = policy(self, index, hand.playable_codes(self.top_code))
+			if choice is None:
+				self.skip(index)
+				return
+		self.play(index, choice[0], choice[1])
+
+	def skip(self, index):
+		if self.history is not None:
+			self.history.append((index, None))
+		self.current_player_index = self.next_player_index()
+
+	def play(self, index, code, wild_color):
+		#Same effects as Game.play, the policy is trusted to play a playable card from its hand
+		hand = self.hands[index]
+		hand.remove(code)
+		self.deck.discard(CARD_OF_CODE[self.top_code])
+		symbol = code_symbol(code)
+		if code_color(code) == "Wild":
+			code = card_code(wild_color, symbol)
+		self.top_code = code
+		if self.history is not None:
+			self.history.append((index, code))
+		if symbol == "R":
+			self.direction *= -1
+		elif symbol == "S":
+			self.current_player_index = self.next_player_index()
+		elif symbol == "D":
+			self.deal_penalty(self.next_player_index(), 2)
+		elif symbol == "D4":
+			self.deal_penalty(self.next_player_index(), 4)
+		if len(hand) == 0:
+			self.rank_list.append(index)
+			self.players_left -= 1
+		self.current_player_index = self.next_player_index()
+
+	def deal_penalty(self, index, amount):
+		for _ in range(amount):
+			if self.deck.is_deck_empty():
+				break
+			self.hands[index].add(self.deck.draw_code())
+
+	def next_player_index(self):
+		ret = (self.current_player_index + self.direction) % self.player_amount
+		while len(self.hands[ret]) == 0:
+			ret = (ret + self.direction) % self.player_amount
+		return ret
+
+
+def random_policy(game, index, playable_codes):
+	if not playable_codes:
+		return None
+	return game.rng.choice(playable_codes), game.rng.choice(COLOR_LIST)
+
+def greedy_policy(game, index, playable_codes):
+	#Plays the card that hurts the next player most and keeps the wild cards for last.
+	#A wild card takes the color the player holds most of
+	if not playable_codes:
+		return None
+	code = max(playable_codes, key = GREEDY_WEIGHT.__getitem__)
+	if code not in WILD_CODES:
+		return code, None
+	counts = game.hands[index].counts
+	return code, max(COLOR_LIST, key = lambda color: sum(counts[color_code] for color_code in COLOR_CODES[color]))
+
+GREEDY_WEIGHT = {code: {"D": 3, "S": 2, "R": 1}.get(code_symbol(code), 0) - 10 * (code_color(code) == "Wild") for code in CARD_OF_CODE}
+WILD_CODES = {card_code(color, symbol) for color in WILD_LIST for symbol in WILD_SYMBOL_LIST}
+COLOR_CODES = {color: [card_code(color, symbol) for symbol in SYMBOL_LIST] for color in COLOR_LIST}
+POLICIES = {'random': random_policy, 'greedy': greedy_policy}
+
+
+class SimulationResult:
+	def __init__(self, policy_names):
+		self.policy_names = policy_names
+		self.games = 0
+		self.unfinished = 0
+		self.wins = Counter() #seat index -> games won
+		self.lengths = Counter() #turns -> games of that length
+		self.longest = None #(turns, seed) of the longest finished game, if the games have seeds
+
+	def add(self, rank_list, turns, seed = None):
+		self.games += 1
+		if len(rank_list) < len(self.policy_names):
+			self.unfinished += 1
+			return
+		self.wins[rank_list[0]] += 1
+		self.lengths[turns] += 1
+		if seed is not None and (self.longest is None or (turns, -seed) > (self.longest[0], -self.longest[1])):
+			self.longest = (turns, seed)
+
+	def merge(self, other):
+		#The result does not depend on the order the results are merged in
+		self.games += other.games
+		self.unfinished += other.unfinished
+		self.wins.update(other.wins)
+		self.lengths.update(other.lengths)
+		if other.longest is not None and (self.longest is None or (other.longest[0], -other.longest[1]) > (self.longest[0], -self.longest[1])):
+			self.longest = other.longest
+
+	def win_rates(self):
+		finished = self.games - self.unfinished
+		return [self.wins[i] / finished if finished else 0 for i in range(len(self.policy_names))]
+
+	def length_percentiles(self, percentiles = (10, 50, 90, 99)):
+		ret, seen, total = {}, 0, sum(self.lengths.values())
+		pending = list(percentiles)
+		for length in sorted(self.lengths):
+			seen += self.lengths[length]
+			while pending and seen * 100 >= pending[0] * total:
+				ret[pending.pop(0)] = length
+		return ret
+
+	def report(self):
+		lines = [str(self.games) + " games, " + str(self.unfinished) + " unfinished"]
+		for i, rate in enumerate(self.win_rates()):
+			lines.append("seat " + str(i) + " (" + self.policy_names[i] + "): " + "{:.1%}".format(rate) + " wins")
+		finished = sum(self.lengths.values())
+		if finished:
+			lines.append("turns: mean " + "{:.1f}".format(sum(length * n for length, n in self.lengths.items()) / finished) + ", " +
+				", ".join("p" + str(p) + " " + str(length) for p, length in self.length_percentiles().items()))
+		if self.longest is not None:
+			lines.append("longest game: " + str(self.longest[0]) + " turns, seed " + str(self.longest[1]))
+		return "\n".join(lines)
+
+
+def game_seed(seed, index):
+	return seed << 32 | index
+
+def simulate(policy_names, games, max_turns = MAX_TURNS, seed = None, start = 0):
+	#Plays the games number start to start + games - 1 of the run with the given seed, or unseeded games if seed is None
+	policies = [POLICIES[name] for name in policy_names]
+	result = SimulationResult(policy_names)
+	deck = None
+	for index in range(start, start + games):
+		rng = Random(game_seed(seed, index)) if seed is not None else None
+		game = SimulatedGame(policies, deck, rng)
+		deck = game.deck
+		result.add(game.run(max_turns), game.turns, game_seed(seed, index) if seed is not None else None)
+	return result
+
+def replay(policy_names, seed, max_turns = MAX_TURNS):
+	#Plays the game of the given game seed again, with its history recorded
+	game = SimulatedGame([POLICIES[name] for name in policy_names], rng = Random(seed), record = True)
+	game.run(max_turns)
+	return game
+
+
+if __name__ == '__main__':
+	import argparse
+	import time
+	parser = argparse.ArgumentParser(description = "Play headless games between policies")
+	parser.add_argument('--games', type = int, default = 10000)
+	parser.add_argument('--policies', default = 'greedy,random', help = "Comma separated policy of each seat: " + ", ".join(POLICIES))
+	parser.add_argument('--seed', type = int, default = None)
+	args = parser.parse_args()
+	start = time.time()
+	result = simulate(args.policies.split(','), args.games, seed = args.seed)
+	print(result.report())
+	print("{:.0f} games per second".format(result.games / (time.time() - start)))
@@ -0,0 +1,151 @@
+"""
+store.py
+This file handles where the server state is kept.
+MemoryStore keeps everything in the server process, which is enough for a single server.
+SQLiteStore keeps the usernames and the rooms in a SQLite file shared by several server processes,
+so the processes can split the rooms between them and a restarted process gets its rooms back.
+Rooms are sharded by room number: the server with index i out of n owns the rooms with room_number % n == i.
+"""
+import pickle
+import sqlite3
+import time
+from threading import Lock
+
+
+class MemoryStore:
+	def __init__(self):
+		#The rooms save themselves under their own lock, so the shared fields need one too
+		self.lock = Lock()
+		self.usernames = set()
+		self.rooms = {}
+		self.lobby_version = 0
+
+	def reserve_username(self, username, token = None):
+		#Returns False if the username is already taken
+		with self.lock:
+			if username in self.usernames:
+				return False
+			self.usernames.add(username)
+			return True
+
+	def release_username(self, username):
+		with self.lock:
+			self.usernames.discard(username)
+
+	def touch_username(self, username, now):
+		#Only one process uses the memory store, so the last_seen of the local User is enough
+		pass
+
+	def username_last_seen(self, username):
+		return None
+
+	def token_username(self, token):
+		#Sessions are only looked up in the store by other shards
+		return None
+
+	def save_room(self, room, lobby_changed):
+		#The room object itself stays in the process memory, nothing has to be serialized
+		with self.lock:
+			self.rooms[room.room_number] = room
+			if lobby_changed:
+				self.lobby_version += 1
+
+	def delete_room(self, room_number):
+		with self.lock:
+			self.rooms.pop(room_number, None)
+			self.lobby_version += 1
+
+	def load_rooms(self, shard_index, shard_count):
+		return []
+
+	def get_lobby_version(self):
+		return self.lobby_version
+
+	def room_summaries(self):
+		return {room_number: room_summary(room) for room_number, room in list(self.rooms.items())}
+
+
+class SQLiteStore:
+	def __init__(self, path):
+		#One connection shared by the threads of the process. SQLite itself serializes the processes
+		self.lock = Lock()
+		self.connection = sqlite3.connect(path, timeout = 30, check_same_thread = False, isolation_level = None)
+		with self.lock:
+			self.connection.execute('PRAGMA journal_mode=WAL')
+			self.connection.execute('CREATE TABLE IF NOT EXISTS usernames (username TEXT PRIMARY KEY, last_seen REAL, token TEXT)')
+			columns = [row[1] for row in self.connection.execute('PRAGMA table_info(usernames)')]
+			#Files created before these columns were added
+			if 'last_seen' not in columns:
+				self.connection.execute('ALTER TABLE usernames ADD COLUMN last_seen REAL')
+			if 'token' not in columns:
+				self.connection.execute('ALTER TABLE usernames ADD COLUMN token TEXT')
+			self.connection.execute('CREATE INDEX IF NOT EXISTS usernames_token ON usernames (token)')
+			self.connection.execute('CREATE TABLE IF NOT EXISTS rooms (room_number INTEGER PRIMARY KEY, hostname TEXT, '
+				'user_number INTEGER, in_game INTEGER, state BLOB)')
+			self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)')
+			self.connection.execute("INSERT OR IGNORE INTO meta VALUES ('lobby_version', 0)")
+
+	def reserve_username(self, username, token = None):
+		#The token lets the other shards find the user of a session
+		with self.lock:
+			try:
+				self.connection.execute('INSERT INTO usernames VALUES (?, ?, ?)', (username, time.time(), token))
+				return True
+			except sqlite3.IntegrityError:
+				return False
+
+	def release_username(self, username):
+		with self.lock:
+			self.connection.execute('DELETE FROM usernames WHERE username = ?', (username,))
+
+	def touch_username(self, username, now):
+		#The latest request of the user seen by any of the processes, so a process does not release a username used on another one
+		with self.lock:
+			self.connection.execute('UPDATE usernames SET last_seen = ? WHERE username = ?', (now, username))
+
+	def username_last_seen(self, username):
+		with self.lock:
+			row = self.connection.execute('SELECT last_seen FROM usernames WHERE username = ?', (username,)).fetchone()
+		return row[0] if row is not None else None
+
+	def token_username(self, token):
+		with self.lock:
+			row = self.connection.execute('SELECT username FROM usernames WHERE token = ?', (token,)).fetchone()
+		return row[0] if row is not None else None
+
+	def save_room(self, room, lobby_changed):
+		summary = room_summary(room)
+		state = pickle.dumps(room)
+		with self.lock:
+			self.connection.execute('BEGIN')
+			self.connection.execute('INSERT OR REPLACE INTO rooms VALUES (?, ?, ?, ?, ?)',
+				(room.room_number, summary['hostname'], summary['user_number'], summary['inGame'], state))
+			if lobby_changed:
+				self.connection.execute("UPDATE meta SET value = value + 1 WHERE key = 'lobby_version'")
+			self.connection.execute('COMMIT')
+
+	def delete_room(self, room_number):
+		with self.lock:
+			self.connection.execute('BEGIN')
+			self.connection.execute('DELETE FROM rooms WHERE room_number = ?', (room_number,))
+			self.connection.execute("UPDATE meta SET value = value + 1 WHERE key = 'lobby_version'")
+			self.connection.execute('COMMIT')
+
+	def load_rooms(self, shard_index, shard_count):
+		with self.lock:
+			rows = self.connection.execute('SELECT state FROM rooms WHERE room_number % ? = ?', (shard_count, shard_index)).fetchall()
+		return [pickle.loads(row[0]) for row in rows]
+
+	def get_lobby_version(self):
+		with self.lock:
+			return self.connection.execute("SELECT value FROM meta WHERE key = 'lobby_version'").fetchone()[0]
+
+	def room_summaries(self):
+		with self.lock:
+			rows = self.connection.execute('SELECT room_number, hostname, user_number, in_game FROM rooms').fetchall()
+		return {row[0]: {'user_number': row[2], 'hostname': row[1], 'inGame': bool(row[3])} for row in rows}
+
+
+def room_summary(room):
+	#The room entry shown in the lobby
+	return {'user_number': room.room_info['user_number'], 'hostname': room.hostname, 'inGame': room.inGame}
@@ -0,0 +1,68 @@
+"""
+sweeper.py
+This file handles the clean up of the users and rooms left behind, for example by a client that crashed without sending exit_signal.
+Every SWEEP_INTERVAL seconds the sweeper:
+removes the users not seen for USER_IDLE_TIMEOUT seconds (a bot takes over their turns if they were in a game),
+which also closes the rooms left without a human,
+closes the rooms without any human left in them,
+and drops the games finished for FINISHED_GAME_TIMEOUT seconds, keeping the deck of the room for its next game.
+SWEEP_STATS counts what was reclaimed, it is sent by the stats request.
+"""
+import os
+import time
+import traceback
+from collections import Counter
+from room import *
+
+SWEEP_INTERVAL = float(os.environ.get('UNO_SWEEP_INTERVAL', 60))
+USER_IDLE_TIMEOUT = float(os.environ.get('UNO_USER_IDLE_TIMEOUT', 300))
+FINISHED_GAME_TIMEOUT = 300
+SWEEP_STATS = Counter()
+
+
+def sweep():
+	now = time.time()
+	with REGISTRY_LOCK:
+		users = list(USER_DICT.values())
+		rooms = list(ROOM_DICT.values())
+	for user in users:
+		if user.bot or user.sessions > 0 or now - user.last_seen < USER_IDLE_TIMEOUT:
+			continue
+		#With several shards, the user may be active on another one: the username is only released if no shard saw the user lately
+		last_seen = STORE.username_last_seen(user.username)
+		#Only the rooms closed by the sweep are counted, not the ones their users closed by leaving
+		room = user.room
+		room_open = room is not None and not room.closed
+		try:
+			user.clean_up(release_username = last_seen is None or now - last_seen >= USER_IDLE_TIMEOUT)
+		except KeyError:
+			#The user left at the same time
+			continue
+		SWEEP_STATS['users_expired'] += 1
+		if room_open and room.closed:
+			SWEEP_STATS['rooms_closed'] += 1
+	for room in rooms:
+		with room.lock:
+			if room.closed:
+				continue
+			if all(user.bot for user in room.userlist):
+				for bot in list(room.userlist):
+					bot.release()
+				room.clean_up()
+				SWEEP_STATS['rooms_closed'] += 1
+			elif not room.inGame and room.game is not None and now - room.game_ended_at >= FINISHED_GAME_TIMEOUT:
+				room.game, room.game_info = None, None
+				for user in room.userlist:
+					user.player, user.sent_game_state = None, None
+				SWEEP_STATS['games_reclaimed'] += 1
+	SWEEP_STATS['sweeps'] += 1
+
+def run_sweeper():
+	try:
+		sweep()
+	except Exception:
+		traceback.print_exc()
+	SCHEDULER.call_later(SWEEP_INTERVAL, run_sweeper)
+
+
+SCHEDULER.call_later(SWEEP_INTERVAL, run_sweeper)